@@ -0,0 +1,126 @@
+"""
+Standalone analyzer worker
+
+Leases analyses from the Mongo work queue (services/work_queue.py), runs them
+on a local AnalysisExecutor and writes the results back. Start the API with
+ANALYSIS_EXECUTOR=queue, then run any number of workers on any node that
+reaches the same database:
+
+    cd backend && python analysis_worker.py
+
+Each worker runs ANALYSIS_WORKERS analyses at a time, in worker processes or
+threads as ANALYSIS_EXECUTOR selects ("queue" means the default, processes).
+SIGINT/SIGTERM stop it and hand the tasks it holds back to the queue.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from services.analysis_executor import AnalysisExecutor
+from services.analysis_history import ensure_indexes
+from services.database import client, db
+from services.ingestion import ImageTooLarge
+from services.work_queue import ERROR_TOO_LARGE, AnalysisWorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+async def keep_leased(queue: AnalysisWorkQueue, task_id: str, worker_id: str):
+    """Extend a task's lease every third of the lease length until cancelled"""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        try:
+            if not await queue.extend(task_id, worker_id):
+                logger.warning(f"Lost the lease on analysis task {task_id}")
+                return
+        except Exception as e:
+            logger.error(f"Error extending the lease on analysis task {task_id}: {e}")
+
+
+async def process_task(queue: AnalysisWorkQueue, executor: AnalysisExecutor, task, worker_id: str):
+    """Analyze one leased task and store its outcome"""
+    task_id = task["_id"]
+    heartbeat = asyncio.create_task(keep_leased(queue, task_id, worker_id))
+    try:
+        result = await executor.analyze_multiple_images(task["images"], task.get("time_budget"))
+        await queue.complete(task_id, worker_id, result)
+    except ImageTooLarge as e:
+        await queue.fail(task_id, worker_id, str(e), ERROR_TOO_LARGE)
+    except asyncio.CancelledError:
+        # Shutting down: let another worker start the task right away
+        try:
+            await queue.release(task_id, worker_id)
+        except Exception as e:
+            logger.error(f"Error releasing analysis task {task_id}: {e}")
+        raise
+    except Exception as e:
+        # Analysis errors come back as results, so this is the pool or the database;
+        # the lease runs out and another attempt picks the task up
+        logger.error(f"Error processing analysis task {task_id} (attempt {task['attempts']}): {e}")
+    finally:
+        heartbeat.cancel()
+
+
+async def consume(queue: AnalysisWorkQueue, executor: AnalysisExecutor, worker_id: str):
+    """Lease and process tasks one at a time until cancelled"""
+    while True:
+        try:
+            task = await queue.lease(worker_id)
+        except Exception as e:
+            logger.error(f"Error leasing an analysis task: {e}")
+            task = None
+
+        if task is None:
+            try:
+                await queue.expire_exhausted()
+            except Exception as e:
+                logger.error(f"Error expiring analysis tasks: {e}")
+            await asyncio.sleep(queue.poll_interval)
+            continue
+
+        await process_task(queue, executor, task, worker_id)
+
+
+async def run_worker():
+    mode = os.environ.get('ANALYSIS_EXECUTOR', 'process').lower()
+    executor = AnalysisExecutor(mode='process' if mode == 'queue' else mode)
+    queue = AnalysisWorkQueue(db.analysis_work)
+
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        # The API process keeps retrying them; leasing works without, only slower
+        logger.error(f"Error creating the analysis indexes: {e}")
+    await executor.warm_up()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    # One lease holder per slot, so a lost or released task names the slot that had it
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    consumers = [
+        asyncio.create_task(consume(queue, executor, f"{prefix}:{slot}"))
+        for slot in range(executor.max_workers)
+    ]
+    logger.info(f"Analyzer worker {prefix} consuming with {len(consumers)} slots")
+
+    await stopping.wait()
+    logger.info(f"Analyzer worker {prefix} stopping")
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    executor.shutdown()
+    client.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(run_worker())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Dominant color engine benchmark
+
+Compares every registered color engine against the scikit-learn KMeans
+reference on synthetic skin/eye/lip/hair pixel sets and, optionally, on the
+facial regions of real images. Reports per-call latency and the RGB distance
+between each engine's dominant color and the reference result.
+
+KMeans' "largest cluster" is ill-defined when clusters are close in size, so
+each case also reports how far the reference moves across seeds and by how much
+its largest cluster leads the runner-up. An engine passes a case when its
+distance is within --max-distance or within that reference spread; cases whose
+lead is under --min-margin are reported as ties and not gated.
+
+Usage:
+    python benchmarks/color_engine_benchmark.py [--max-distance 10] [image.jpg ...]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.color_engine import COLOR_ENGINES, KMeansColorEngine  # noqa: E402
+
+REFERENCE = KMeansColorEngine.name
+
+
+def synthetic_region(rng, tones, spread, n_pixels, shadow_fraction=0.1, highlight_fraction=0.05):
+    """Pixels drawn from weighted RGB tones, plus shadows and highlights
+
+    ``tones`` is a list of (rgb, weight) pairs. The first tone should clearly
+    outweigh the others, as the dominant tone of a real facial region does;
+    near-tied clusters make the "largest cluster" ill-defined even for KMeans.
+    """
+    n_shadow = int(n_pixels * shadow_fraction)
+    n_highlight = int(n_pixels * highlight_fraction)
+    n_toned = n_pixels - n_shadow - n_highlight
+    weights = np.array([weight for _, weight in tones], dtype=np.float64)
+    counts = np.floor(weights / weights.sum() * n_toned).astype(int)
+    counts[0] += n_toned - counts.sum()
+
+    parts = [
+        np.array(rgb, dtype=np.float32) + rng.normal(0, spread, (count, 3))
+        for (rgb, _), count in zip(tones, counts)
+    ]
+    parts.append(rng.uniform(0, 15, (n_shadow, 3)))
+    parts.append(rng.uniform(225, 255, (n_highlight, 3)))
+    pixels = np.clip(np.vstack(parts), 0, 255).astype(np.uint8)
+    return pixels[rng.permutation(len(pixels))]
+
+
+def synthetic_cases():
+    rng = np.random.default_rng(0)
+    regions = {
+        'skin': ([((215, 170, 140), 6), ((170, 125, 100), 2), ((230, 200, 180), 1)], 10, 0.1),
+        'eye': ([((90, 60, 40), 5), ((210, 200, 195), 2), ((35, 25, 20), 1)], 10, 0.2),
+        'lip': ([((190, 105, 110), 6), ((150, 75, 80), 2), ((215, 160, 150), 1)], 10, 0.1),
+        'hair': ([((90, 60, 40), 6), ((55, 35, 25), 2), ((140, 105, 75), 1)], 10, 0.25),
+    }
+    cases = {}
+    for size in (500, 5000, 50000):
+        for region, (tones, spread, shadow_fraction) in regions.items():
+            cases[f"{region}/{size}"] = synthetic_region(rng, tones, spread, size, shadow_fraction)
+    return cases
+
+
+def image_cases(paths):
+    from services.face_analyzer import FaceAnalyzer
+
+    analyzer = FaceAnalyzer()
+    cases = {}
+    for path in paths:
+        image = analyzer.decode_image(Path(path).read_bytes())
+        landmarks = analyzer.extract_face_landmarks(image)
+        if not landmarks:
+            print(f"  skipping {path}: no face detected")
+            continue
+        regions = {
+            'skin': analyzer.SKIN_LANDMARKS,
+            'left_eye': analyzer.EYE_LANDMARKS['left_eye'],
+            'lip': analyzer.LIP_LANDMARKS,
+            'hair': analyzer.HAIR_LANDMARKS,
+        }
+        for region, indices in regions.items():
+            cases[f"{Path(path).name}/{region}"] = analyzer.get_region_pixels(image, landmarks, indices)
+    return cases
+
+
+def reference_stability(pixels, seeds=(0, 1, 2)):
+    """Seed-to-seed spread of the reference color and the largest cluster's relative lead"""
+    from sklearn.cluster import KMeans
+
+    engine = KMeansColorEngine()
+    baseline = engine.dominant_color(pixels)
+    spread = max(
+        float(np.linalg.norm(KMeansColorEngine(seed=seed).dominant_color(pixels) - baseline))
+        for seed in seeds
+    )
+
+    valid_pixels = engine.filter_pixels(pixels)
+    labels = KMeans(n_clusters=min(3, len(valid_pixels)), random_state=engine.seed,
+                    n_init=10).fit(valid_pixels).labels_
+    counts = np.sort(np.bincount(labels))[::-1]
+    margin = (counts[0] - counts[1]) / counts[0] if len(counts) > 1 else 1.0
+    return spread, float(margin)
+
+
+def time_engine(engine, pixels, repeat):
+    engine.dominant_color(pixels)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        color = engine.dominant_color(pixels)
+    return (time.perf_counter() - start) / repeat * 1000, np.asarray(color, dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='optional face images to sample real regions from')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-distance', type=float, default=10.0,
+                        help='maximum allowed RGB distance from the KMeans reference')
+    parser.add_argument('--min-margin', type=float, default=0.05,
+                        help='minimum lead of the reference largest cluster for a case to be gated')
+    args = parser.parse_args()
+
+    cases = synthetic_cases()
+    if args.images:
+        cases.update(image_cases(args.images))
+
+    engines = {name: cls() for name, cls in COLOR_ENGINES.items()}
+    totals = {name: 0.0 for name in engines}
+    worst = {name: 0.0 for name in engines if name != REFERENCE}
+    failures = {name: [] for name in worst}
+
+    header = f"{'case':<28}{'pixels':>8}" + "".join(f"{name + ' ms':>12}" for name in engines)
+    header += f"{'ref spread':>12}{'ref margin':>12}" + "".join(f"{name + ' dist':>12}" for name in worst)
+    print(header)
+    print("-" * len(header))
+
+    for case, pixels in cases.items():
+        timings = {}
+        colors = {}
+        for name, engine in engines.items():
+            timings[name], colors[name] = time_engine(engine, pixels, args.repeat)
+            totals[name] += timings[name]
+
+        spread, margin = reference_stability(pixels)
+        tie = margin < args.min_margin
+        row = f"{case:<28}{len(pixels):>8}" + "".join(f"{timings[name]:>12.2f}" for name in engines)
+        row += f"{spread:>12.2f}{margin:>12.1%}"
+        for name in worst:
+            distance = float(np.linalg.norm(colors[name] - colors[REFERENCE]))
+            row += f"{distance:>12.2f}"
+            if tie:
+                continue
+            worst[name] = max(worst[name], distance)
+            if distance > max(args.max_distance, spread):
+                failures[name].append(case)
+        if tie:
+            row += "  (tie)"
+        print(row)
+
+    print("-" * len(header))
+    for name in engines:
+        speedup = totals[REFERENCE] / totals[name] if totals[name] else float('inf')
+        print(f"{name:<10} total {totals[name]:>9.2f} ms   speedup vs {REFERENCE}: {speedup:>6.1f}x")
+
+    for name, distance in worst.items():
+        status = f"FAIL: {', '.join(failures[name])}" if failures[name] else "ok"
+        print(f"{name:<10} max gated distance from {REFERENCE}: {distance:.2f} "
+              f"(limit {args.max_distance}) {status}")
+
+    return 1 if any(failures.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
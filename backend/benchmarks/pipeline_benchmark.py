@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Analysis pipeline benchmark
+
+Runs each FaceAnalyzer stage in isolation, offline, over the checked-in
+corpus (benchmarks/corpus) re-encoded at several resolutions: base64 decode,
+image decode, FaceMesh landmarks, per-region rasterization, per-region
+dominant color clustering and the full single-image analysis. For every
+stage it reports the best-of-N latency (the least noisy estimate), taken
+over several interleaved rounds so a burst of host load cannot hit every
+sample of one stage, along with throughput and the peak Python heap
+allocation (tracemalloc: NumPy buffers are counted, OpenCV and MediaPipe
+native memory is not).
+
+Results can be saved as a baseline and later runs compared against it; a
+stage regresses when it is more than --threshold slower (or larger) than the
+baseline and also past an absolute margin, which keeps millisecond-scale
+stages from flagging on noise. A stage that is flagged is timed again for as
+many rounds before the run fails, so only a slowdown that repeats counts.
+Timings also differ between processes (memory layout, allocator state), so
+record a baseline from several runs: --save once, then --save --merge a few
+more times, which keeps each stage's slowest best-of. Timings are machine specific, so keep one
+baseline per CI runner type; within a runner type, each run also times a fixed
+NumPy/OpenCV calibration workload and baseline timings are scaled by the
+speed ratio, so a slower or busier host does not show up as a regression.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--save baseline.json [--merge]] [--baseline baseline.json] [--threshold 0.5]
+"""
+
+import argparse
+import base64
+import io
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image  # noqa: E402
+
+from services.analysis_cache import AnalysisCache  # noqa: E402
+from services.face_analyzer import FaceAnalyzer  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+RESOLUTIONS = (320, 640, 1280, 1920)
+
+# Absolute margins below which a relative slowdown is treated as noise
+MIN_REGRESSION_MS = 1.0
+MIN_REGRESSION_KB = 64
+
+
+def corpus_cases(resolutions):
+    """Every corpus image re-encoded as JPEG with its longest side at each resolution"""
+    cases = {}
+    for path in sorted(CORPUS_DIR.iterdir()):
+        if path.suffix.lower() not in ('.jpg', '.jpeg', '.png'):
+            continue
+        source = Image.open(path).convert('RGB')
+        for size in resolutions:
+            scale = size / max(source.size)
+            resized = source.resize((round(source.width * scale), round(source.height * scale)), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format='JPEG', quality=90)
+            cases[f"{path.stem}@{size}"] = (buffer.getvalue(), resized.width * resized.height)
+    return cases
+
+
+def time_calls(func, repeat):
+    """Fastest milliseconds per call over ``repeat`` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def time_rounds(benchmarks, rounds, repeat):
+    """Fastest milliseconds per call of every benchmark over interleaved rounds"""
+    timings = {key: float('inf') for key in benchmarks}
+    for _ in range(rounds):
+        for key, (func, _) in benchmarks.items():
+            timings[key] = min(timings[key], time_calls(func, repeat))
+    return timings
+
+
+def peak_allocation(func):
+    """Peak traced allocation in KiB of one call"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def calibrate(repeat=20):
+    """Best-of-N milliseconds of a fixed workload resembling the pipeline's kernels"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    points = rng.random((4096, 3), dtype=np.float32)
+
+    def workload():
+        cv2.resize(image, (320, 240), interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(image, (5, 5), 0)
+        np.argsort(image.reshape(-1), kind='stable')
+        points @ points.T
+
+    workload()
+    return time_calls(workload, repeat)
+
+
+def stage_functions(analyzer, image_bytes):
+    """Stage name -> zero-argument callable, for every stage that applies to this image"""
+    image_base64 = base64.b64encode(image_bytes).decode()
+    image = analyzer.decode_image(image_bytes)
+    stages = {
+        'base64': lambda: analyzer.base64_to_image(image_base64),
+        'decode': lambda: analyzer.decode_image(image_bytes),
+        'landmarks': lambda: analyzer.extract_face_landmarks(image),
+    }
+
+    landmarks = analyzer.extract_face_landmarks(image)
+    if landmarks:
+        regions = {
+            'skin': analyzer.SKIN_LANDMARKS,
+            'left_eye': analyzer.EYE_LANDMARKS['left_eye'],
+            'lips': analyzer.LIP_LANDMARKS,
+            'hair': analyzer.HAIR_LANDMARKS,
+        }
+        for region, indices in regions.items():
+            stages[f'rasterize/{region}'] = (
+                lambda indices=indices: analyzer.get_region_pixels(image, landmarks, indices)
+            )
+        stages['rasterize/all'] = lambda: analyzer.extract_region_pixels(image, landmarks)
+
+        for region, pixels in analyzer.extract_region_pixels(image, landmarks).items():
+            pixels = pixels.copy()
+            stages[f'cluster/{region}'] = lambda pixels=pixels: analyzer.extract_dominant_color(pixels)
+
+    stages['analyze'] = lambda: analyzer.analyze_single_image(image)
+    return stages
+
+
+def compare(results, baseline, threshold, speed_ratio=1.0):
+    """(key, message) for every result that is worse than the baseline beyond the threshold
+
+    Baseline timings are multiplied by ``speed_ratio`` (this host's calibration
+    time over the baseline's) before comparing; memory is compared as is.
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        expected_ms = previous['ms'] * speed_ratio
+        if (current['ms'] > expected_ms * (1 + threshold)
+                and current['ms'] - expected_ms > MIN_REGRESSION_MS):
+            regressions.append((key, f"{key}: {expected_ms:.2f} (scaled) -> {current['ms']:.2f} ms"))
+        if (current['peak_kb'] > previous['peak_kb'] * (1 + threshold)
+                and current['peak_kb'] - previous['peak_kb'] > MIN_REGRESSION_KB):
+            regressions.append((key, f"{key}: {previous['peak_kb']:.0f} -> {current['peak_kb']:.0f} KiB peak"))
+    return regressions
+
+
+def merge(results, calibration_ms, previous):
+    """Per-stage maximum of this run and a previous baseline, in this run's host speed"""
+    scale = calibration_ms / previous['calibration_ms'] if previous.get('calibration_ms') else 1.0
+    merged = {key: dict(result) for key, result in results.items()}
+    for key, result in previous['results'].items():
+        if key not in merged:
+            continue
+        merged[key]['ms'] = max(merged[key]['ms'], round(result['ms'] * scale, 4))
+        merged[key]['peak_kb'] = max(merged[key]['peak_kb'], result['peak_kb'])
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per stage in each round')
+    parser.add_argument('--rounds', type=int, default=5, help='interleaved passes over every stage')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed calls per stage before the first round')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=list(RESOLUTIONS),
+                        help='longest image side of each corpus variant')
+    parser.add_argument('--max-dimension', type=int, default=None,
+                        help='analyzer working resolution (default: ANALYSIS_MAX_DIMENSION or 640, 0 = full size)')
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--merge', action='store_true',
+                        help='fold the results into the existing --save file, keeping the slower value per stage')
+    parser.add_argument('--baseline', help='compare against this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='relative slowdown or memory growth that counts as a regression')
+    args = parser.parse_args()
+
+    analyzer = FaceAnalyzer(max_dimension=args.max_dimension, cache=AnalysisCache(max_entries=0))
+    analyzer.warm_up()
+    calibration_ms = calibrate()
+    print(f"calibration workload: {calibration_ms:.2f} ms")
+
+    # (case, stage) -> (callable, source pixels); every callable runs --warmup times untimed first
+    benchmarks = {}
+    for case, (image_bytes, pixels) in corpus_cases(args.resolutions).items():
+        for stage, func in stage_functions(analyzer, image_bytes).items():
+            for _ in range(args.warmup):
+                func()
+            benchmarks[(case, stage)] = (func, pixels)
+
+    timings = time_rounds(benchmarks, args.rounds, args.repeat)
+
+    results = {}
+    header = f"{'case':<28}{'stage':<20}{'ms':>10}{'ops/s':>10}{'MP/s':>10}{'peak KiB':>12}"
+    print(header)
+    print("-" * len(header))
+    for (case, stage), (func, pixels) in benchmarks.items():
+        elapsed = timings[(case, stage)]
+        peak_kb = peak_allocation(func)
+        results[f"{case}/{stage}"] = {'ms': round(elapsed, 4), 'peak_kb': round(peak_kb, 1)}
+
+        # Decoding scales with the source image; later stages work at the analyzer's resolution
+        megapixels = f"{pixels / 1e6 / (elapsed / 1000):>10.1f}" if stage in ('base64', 'decode') else f"{'':>10}"
+        print(f"{case:<28}{stage:<20}{elapsed:>10.2f}{1000 / elapsed:>10.0f}{megapixels}{peak_kb:>12.0f}")
+
+    # Re-calibrate after the run as well, and take the faster, to catch drift mid-run
+    calibration_ms = min(calibration_ms, calibrate())
+
+    if args.save:
+        saved = results
+        if args.merge and Path(args.save).exists():
+            saved = merge(results, calibration_ms, json.loads(Path(args.save).read_text()))
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps({
+            'max_dimension': analyzer.max_dimension,
+            'color_engine': analyzer.color_engine.name,
+            'calibration_ms': round(calibration_ms, 4),
+            'results': saved
+        }, indent=2, sort_keys=True) + "\n")
+        print(f"saved {len(saved)} results to {args.save}")
+
+    if not args.baseline:
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    if (baseline.get('max_dimension'), baseline.get('color_engine')) != (analyzer.max_dimension, analyzer.color_engine.name):
+        print(f"warning: baseline was recorded with max_dimension={baseline.get('max_dimension')}, "
+              f"color_engine={baseline.get('color_engine')}")
+
+    speed_ratio = calibration_ms / baseline['calibration_ms'] if baseline.get('calibration_ms') else 1.0
+    print(f"host speed vs baseline: {1 / speed_ratio:.2f}x (baseline timings scaled by {speed_ratio:.2f})")
+
+    regressions = compare(results, baseline['results'], args.threshold, speed_ratio)
+    if regressions:
+        # A burst of host load during a stage's rounds looks like a regression; a real one repeats
+        by_name = {f"{case}/{stage}": (case, stage) for case, stage in benchmarks}
+        flagged = {by_name[key]: benchmarks[by_name[key]] for key, _ in regressions}
+        print(f"timing {len(flagged)} flagged stages again")
+        for (case, stage), elapsed in time_rounds(flagged, args.rounds, args.repeat).items():
+            result = results[f"{case}/{stage}"]
+            result['ms'] = min(result['ms'], round(elapsed, 4))
+        regressions = compare(results, baseline['results'], args.threshold, speed_ratio)
+
+    missing = sorted(set(baseline['results']) - set(results))
+    if missing:
+        print(f"not measured this run: {', '.join(missing)}")
+    for _, regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+
+Measures, in fresh interpreters, how long the API and analysis worker modules
+take to import, and whether the API process pulled in any of the heavy vision
+dependencies (they belong in the workers and the warm-up phase). It then
+starts the server with uvicorn and records the time to the first /api/health
+response and to /api/ready, optionally followed by a first analysis.
+
+The server needs MONGO_URL and DB_NAME (backend/.env is loaded); without a
+reachable Mongo it still starts once index creation times out, so set
+MONGO_SERVER_SELECTION_TIMEOUT_MS low when benchmarking without a database.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--max-import-ms 1500] [--max-first-response-ms 5000] [image.jpg]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Modules the API process must not import at startup
+HEAVY_MODULES = ('cv2', 'mediapipe', 'numpy', 'PIL', 'sklearn')
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def measure_import(module, repeat):
+    """Median import time of ``module`` in fresh interpreters, and the heavy modules it loaded"""
+    timings = []
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        heavy = result['heavy']
+    return statistics.median(timings), heavy
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    """Monotonic time at which ``url`` first answers 200, or None if the deadline passes"""
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.monotonic()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def post_image(url, image_path):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="images"; filename="{Path(image_path).name}"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + Path(image_path).read_bytes() + f'\r\n--{boundary}--\r\n'.encode()
+    request = urllib.request.Request(url, data=body, headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}'
+    })
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def measure_server(image, timeout):
+    """Launch uvicorn and time first response, readiness and (optionally) a first analysis"""
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}/api'
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    results = {}
+    try:
+        deadline = started + timeout
+        first_response = wait_for(f'{base_url}/health', deadline)
+        results['first_response_ms'] = (first_response - started) * 1000 if first_response else None
+        ready = wait_for(f'{base_url}/ready', deadline) if first_response else None
+        results['ready_ms'] = (ready - started) * 1000 if ready else None
+
+        if image and ready:
+            request_start = time.monotonic()
+            response = post_image(f'{base_url}/analysis/analyze-face/upload', image)
+            results['first_analysis_ms'] = (time.monotonic() - request_start) * 1000
+            results['first_analysis_success'] = response.get('success')
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', nargs='?', help='optional face image for a first analysis after readiness')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per import measurement')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for the server')
+    parser.add_argument('--max-import-ms', type=float, default=1500,
+                        help='maximum import time of the API server module')
+    parser.add_argument('--max-first-response-ms', type=float, default=5000,
+                        help='maximum time from launch to the first /api/health response')
+    parser.add_argument('--skip-server', action='store_true', help='only measure imports')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    failures = []
+    results = {}
+
+    for module in ('server', 'services.face_analyzer'):
+        elapsed, heavy = measure_import(module, args.repeat)
+        results[f'import_{module}_ms'] = elapsed
+        print(f"import {module:<24}{elapsed:>10.0f} ms   heavy modules: {', '.join(heavy) or 'none'}")
+        if module == 'server':
+            if heavy:
+                failures.append(f"API process imports {', '.join(heavy)} at startup")
+            if elapsed > args.max_import_ms:
+                failures.append(f"server import took {elapsed:.0f} ms (limit {args.max_import_ms:.0f})")
+
+    if not args.skip_server:
+        server = measure_server(args.image, args.timeout)
+        results.update(server)
+        for key, value in server.items():
+            print(f"{key:<31}{value if isinstance(value, bool) or value is None else f'{value:>10.0f} ms'}")
+        first_response = server.get('first_response_ms')
+        if first_response is None:
+            failures.append("server never answered /api/health")
+        elif first_response > args.max_first_response_ms:
+            failures.append(f"first response took {first_response:.0f} ms (limit {args.max_first_response_ms:.0f})")
+        if server.get('ready_ms') is None:
+            failures.append("server never reported ready")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("ok")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,9 @@ class FaceAnalysisRequest(BaseModel):
         
         return v
 
+class BatchAnalysisRequest(BaseModel):
+    items: List[FaceAnalysisRequest] = Field(..., min_items=1, max_items=1000, description="Capture sets to analyze")
+
 class ColorAnalysis(BaseModel):
     skin_tone: str = Field(..., description="Skin tone HEX color")
     eye_color: str = Field(..., description="Eye color HEX color") 
@@ -46,6 +49,7 @@ class AnalysisMetadata(BaseModel):
     processing_time_ms: int = Field(..., description="Total processing time in milliseconds")
     algorithm: str = Field(default="MediaPipe + K-means clustering", description="Analysis algorithm used")
     confidence_score: float = Field(default=0.85, ge=0.0, le=1.0, description="Overall confidence score")
+    partial: bool = Field(default=False, description="Whether the time budget ran out before every image was analyzed")
 
 class FaceAnalysisResponse(BaseModel):
     success: bool = Field(..., description="Whether analysis was successful")
@@ -55,6 +59,21 @@ class FaceAnalysisResponse(BaseModel):
     error: Optional[str] = Field(None, description="Error message if analysis failed")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
 
+class BoundingBox(BaseModel):
+    x: float = Field(..., description="Left edge as a fraction of the frame width")
+    y: float = Field(..., description="Top edge as a fraction of the frame height")
+    width: float = Field(..., description="Width as a fraction of the frame width")
+    height: float = Field(..., description="Height as a fraction of the frame height")
+
+class PresenceResponse(BaseModel):
+    face_detected: bool = Field(..., description="Whether a face was found in the frame")
+    score: Optional[float] = Field(None, description="Detection confidence")
+    bbox: Optional[BoundingBox] = Field(None, description="Face bounding box, normalized to the frame")
+    yaw: Optional[float] = Field(None, description="Head rotation in degrees, positive when turned to the user's left")
+    pose: Optional[str] = Field(None, description="front, left or right; null while between poses")
+    step_ok: Optional[bool] = Field(None, description="Whether the pose matches the requested capture step")
+    processing_time_ms: float = Field(..., description="Server-side time spent on the check")
+
 class AnalysisRecord(BaseModel):
     """Database model for storing analysis results"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -65,6 +84,17 @@ class AnalysisRecord(BaseModel):
     ip_address: Optional[str] = Field(None)
     user_agent: Optional[str] = Field(None)
 
+class AnalysisJob(BaseModel):
+    """Database model for an asynchronous analysis job"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = Field(default="queued", description="queued, running, completed or failed")
+    session_id: Optional[str] = Field(None)
+    total_images: int = Field(..., description="Number of images submitted")
+    result: Optional[FaceAnalysisResponse] = Field(None, description="Analysis response once completed")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class AnalysisStats(BaseModel):
     """Statistics model for analysis tracking"""
     total_analyses: int = Field(default=0)
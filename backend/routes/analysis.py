@@ -1,177 +1,383 @@
-from fastapi import APIRouter, HTTPException, Request
-from typing import Dict, Any
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, Tuple, Union
+import asyncio
+import json
 import logging
 import time
 from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
-from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-ROOT_DIR = Path(__file__).parent.parent
-load_dotenv(ROOT_DIR / '.env')
+from pymongo.errors import BulkWriteError
 
 from models.analysis import (
+    BatchAnalysisRequest,
     FaceAnalysisRequest, 
     FaceAnalysisResponse, 
     ColorAnalysis, 
     AnalysisMetadata,
     AnalysisRecord
 )
-from services.face_analyzer import FaceAnalyzer
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from services.admission import DEADLINE_HEADER, AdmissionController, AdmissionRejected
+from services.analysis_executor import AnalysisQueueFull, create_analysis_executor
+from services.analysis_history import HISTORY_SORT, encode_cursor, history_filter, history_projection
+from services.analysis_stats import AnalysisStatsAggregator
+from services.ingestion import ImageTooLarge, check_image_sizes, check_request
+from services.database import db
+from services.metrics import REQUEST_SECONDS, REQUESTS_TOTAL, STAGE_SECONDS
+from services.record_writer import RecordWriter
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
-# Initialize face analyzer
-face_analyzer = FaceAnalyzer()
+# First and longest backoff of background work that still finds the analysis queue full
+BACKGROUND_RETRY_DELAY = 0.05
+BACKGROUND_MAX_RETRY_DELAY = 1.0
+
+# Face analysis runs in a pool of worker processes, each with its own FaceAnalyzer,
+# or on standalone analyzer workers fed through the Mongo work queue
+analysis_executor = create_analysis_executor()
+
+# Interactive analyses wait for one of these slots, or are shed if they cannot start in time
+admission = AdmissionController(analysis_executor.max_workers)
+
+# Batch items and jobs share these slots (one per worker at most), so however many
+# run at once they leave the executor capacity of admitted interactive requests free
+background_slots = asyncio.Semaphore(max(1, min(
+    analysis_executor.max_workers,
+    analysis_executor.max_queue_depth - admission.concurrency
+)))
+
+# Analysis records are written behind the response, in batches
+record_writer = RecordWriter(db.face_analyses)
+
+# Running totals behind /stats, counted as analyses finish
+analysis_stats = AnalysisStatsAggregator(db.analysis_stats, db.face_analyses)
 
 @router.post("/analyze-face", response_model=FaceAnalysisResponse)
 async def analyze_face(request: FaceAnalysisRequest, http_request: Request):
     """
-    Analyze facial features from uploaded images and extract color palette
+    Analyze facial features from uploaded images and extract color palette.
+    
+    Send ``X-Deadline-Ms`` with how long the client will wait; a request that
+    cannot start analyzing within it is rejected at once with 503 and
+    Retry-After instead of queueing.
+    """
+    # Extract base64 image data
+    image_data = [img.data for img in request.images]
+    
+    return await run_face_analysis(image_data, request.session_id, http_request)
+
+@router.post("/analyze-face/upload", response_model=FaceAnalysisResponse)
+async def analyze_face_upload(
+    http_request: Request,
+    images: List[UploadFile] = File(..., description="Captured images as binary parts"),
+    steps: List[int] = Form(default=[], description="Capture step of each image: 0=front, 1=left, 2=right"),
+    session_id: Optional[str] = Form(default=None, description="Session identifier")
+):
     """
+    Analyze facial features from multipart image uploads and extract color palette.
+    
+    Same semantics as /analyze-face without the base64 and JSON overhead: the
+    raw image bytes are passed straight to the decoder.
+    """
+    if not 1 <= len(images) <= 3:
+        raise HTTPException(status_code=422, detail="Between 1 and 3 images are required")
+    
+    if steps:
+        if len(steps) != len(images):
+            raise HTTPException(status_code=422, detail="One step is required per image")
+        if any(step < 0 or step > 2 for step in steps):
+            raise HTTPException(status_code=422, detail="Steps must be 0 (front), 1 (left) or 2 (right)")
+        if len(set(steps)) != len(steps):
+            raise HTTPException(status_code=422, detail="Duplicate steps found in images")
+    
+    # Refuse oversized parts before reading them into memory
+    try:
+        check_image_sizes([image.size or 0 for image in images])
+    except ImageTooLarge as e:
+        REQUESTS_TOTAL.inc(1, "upload", "rejected")
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    image_data = [await image.read() for image in images]
+    
+    return await run_face_analysis(image_data, session_id, http_request, endpoint="upload")
+
+async def run_face_analysis(image_data: List[Union[str, bytes]], session_id: Optional[str],
+                            http_request: Request, endpoint: str = "analyze-face") -> FaceAnalysisResponse:
+    """Run the analysis pipeline and store the result, shared by the JSON and upload endpoints"""
     start_time = time.time()
     
     try:
-        logger.info(f"Starting face analysis for {len(request.images)} images")
-        
-        # Extract base64 image data
-        image_data = [img.data for img in request.images]
+        logger.info(f"Starting face analysis for {len(image_data)} images")
+        check_request(image_data)
         
-        # Perform face analysis
-        analysis_result = face_analyzer.analyze_multiple_images(image_data)
+        # Perform face analysis in the worker pool, once admitted before the client's deadline
+        timeout = admission.timeout_from_header(http_request.headers.get(DEADLINE_HEADER))
+        async with admission.admit(timeout) as waited:
+            # Images started after the client's deadline would only make the response later
+            analysis_result = await analysis_executor.analyze_multiple_images(image_data, timeout - waited)
+        STAGE_SECONDS.observe(time.time() - start_time, 'analyze', '')
         
         processing_time = int((time.time() - start_time) * 1000)  # Convert to milliseconds
         
-        if not analysis_result['success']:
-            logger.error(f"Face analysis failed: {analysis_result.get('error', 'Unknown error')}")
-            return FaceAnalysisResponse(
-                success=False,
-                error=analysis_result.get('error', 'Analysis failed'),
-                metadata=AnalysisMetadata(
-                    total_images=len(request.images),
-                    images_analyzed=0,
-                    processing_time_ms=processing_time
-                )
-            )
-        
-        # Create color analysis result
-        colors = ColorAnalysis(
-            skin_tone=analysis_result['results']['skin_tone'],
-            eye_color=analysis_result['results']['eye_color'],
-            lip_color=analysis_result['results']['lip_color'],
-            hair_color=analysis_result['results']['hair_color']
-        )
+        response = build_analysis_response(analysis_result, len(image_data), processing_time)
+        analysis_stats.record(response)
+        REQUESTS_TOTAL.inc(1, endpoint, "success" if response.success else "failure")
+        REQUEST_SECONDS.observe(time.time() - start_time, endpoint)
         
-        # Create metadata
-        metadata = AnalysisMetadata(
-            total_images=analysis_result['total_images'],
-            images_analyzed=analysis_result['images_analyzed'],
-            processing_time_ms=processing_time,
-            confidence_score=0.85 + (analysis_result['images_analyzed'] / analysis_result['total_images']) * 0.15
-        )
+        if not response.success:
+            logger.error(f"Face analysis failed: {response.error}")
+            return response
         
-        # Create response
-        response = FaceAnalysisResponse(
-            success=True,
-            colors=colors,
-            metadata=metadata
+        # Queue the analysis for storage; a failed write never fails the request
+        analysis_record = build_analysis_record(
+            response, session_id, http_request.client.host, http_request.headers.get("user-agent")
         )
-        
-        # Store analysis in database
-        try:
-            analysis_record = AnalysisRecord(
-                session_id=request.session_id,
-                colors=colors,
-                metadata=metadata,
-                ip_address=http_request.client.host,
-                user_agent=http_request.headers.get("user-agent")
-            )
-            
-            await db.face_analyses.insert_one(analysis_record.dict())
-            logger.info(f"Analysis record stored with ID: {analysis_record.id}")
-            
-        except Exception as e:
-            logger.error(f"Error storing analysis record: {e}")
-            # Don't fail the request if database storage fails
+        if record_writer.add(analysis_record.dict()):
+            logger.info(f"Analysis record queued with ID: {analysis_record.id}")
         
         logger.info(f"Face analysis completed successfully in {processing_time}ms")
         return response
         
+    except AnalysisQueueFull as e:
+        logger.warning(f"Rejecting face analysis: {e}")
+        REQUESTS_TOTAL.inc(1, endpoint, "rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+        
+    except AdmissionRejected as e:
+        logger.warning(f"Shedding face analysis: {e}")
+        REQUESTS_TOTAL.inc(1, endpoint, "rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+        
+    except ImageTooLarge as e:
+        logger.warning(f"Rejecting face analysis: {e}")
+        REQUESTS_TOTAL.inc(1, endpoint, "rejected")
+        raise HTTPException(status_code=413, detail=str(e))
+        
     except Exception as e:
         logger.error(f"Unexpected error during face analysis: {e}")
         processing_time = int((time.time() - start_time) * 1000)
         
-        return FaceAnalysisResponse(
-            success=False,
-            error=f"Analysis failed: {str(e)}",
-            metadata=AnalysisMetadata(
-                total_images=len(request.images),
-                images_analyzed=0,
-                processing_time_ms=processing_time
-            )
+        response = analysis_failure_response(f"Analysis failed: {str(e)}", len(image_data), processing_time)
+        analysis_stats.record(response)
+        REQUESTS_TOTAL.inc(1, endpoint, "error")
+        REQUEST_SECONDS.observe(time.time() - start_time, endpoint)
+        return response
+
+def analysis_failure_response(error: str, total_images: int, processing_time: int,
+                              partial: bool = False) -> FaceAnalysisResponse:
+    """Response for an analysis that produced no colors"""
+    return FaceAnalysisResponse(
+        success=False,
+        error=error,
+        metadata=AnalysisMetadata(
+            total_images=total_images,
+            images_analyzed=0,
+            processing_time_ms=processing_time,
+            partial=partial
+        )
+    )
+
+def build_analysis_response(analysis_result: Dict[str, Any], total_images: int,
+                            processing_time: int) -> FaceAnalysisResponse:
+    """Turn a FaceAnalyzer result into the API response"""
+    if not analysis_result['success']:
+        return analysis_failure_response(
+            analysis_result.get('error', 'Analysis failed'), total_images, processing_time,
+            analysis_result.get('partial', False)
         )
+    
+    # Create color analysis result
+    colors = ColorAnalysis(
+        skin_tone=analysis_result['results']['skin_tone'],
+        eye_color=analysis_result['results']['eye_color'],
+        lip_color=analysis_result['results']['lip_color'],
+        hair_color=analysis_result['results']['hair_color']
+    )
+    
+    # Create metadata
+    metadata = AnalysisMetadata(
+        total_images=analysis_result['total_images'],
+        images_analyzed=analysis_result['images_analyzed'],
+        processing_time_ms=processing_time,
+        confidence_score=0.85 + (analysis_result['images_analyzed'] / analysis_result['total_images']) * 0.15,
+        partial=analysis_result.get('partial', False)
+    )
+    
+    return FaceAnalysisResponse(
+        success=True,
+        colors=colors,
+        metadata=metadata
+    )
+
+def build_analysis_record(response: FaceAnalysisResponse, session_id: Optional[str],
+                          ip_address: Optional[str], user_agent: Optional[str]) -> AnalysisRecord:
+    """Database record for a successful analysis"""
+    return AnalysisRecord(
+        session_id=session_id,
+        colors=response.colors,
+        metadata=response.metadata,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
+
+async def analyze_when_admitted(image_data: List[Union[str, bytes]]) -> Dict[str, Any]:
+    """Run an analysis for background work (batches, jobs) while holding one of ``background_slots``"""
+    delay = BACKGROUND_RETRY_DELAY
+    while True:
+        try:
+            return await analysis_executor.analyze_multiple_images(image_data)
+        except AnalysisQueueFull:
+            # Only when no pooled analyzer freed up in time, or the queue is configured
+            # smaller than the slots; back off rather than dropping the work
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BACKGROUND_MAX_RETRY_DELAY)
+
+@router.post("/analyze-face/batch")
+async def analyze_face_batch(request: BatchAnalysisRequest, http_request: Request):
+    """
+    Analyze many capture sets in one request.
+    
+    Items are spread across the analysis workers and each result is streamed
+    back as one NDJSON line (``index``, ``session_id`` and the usual
+    FaceAnalysisResponse fields) as soon as it finishes, so lines arrive out of
+    order. Successful records are stored with a single bulk write, and a final
+    ``{"done": true, ...}`` line reports the totals.
+    """
+    return StreamingResponse(
+        stream_batch_results(request.items, http_request),
+        media_type="application/x-ndjson"
+    )
+
+async def analyze_batch_item(index: int, item: FaceAnalysisRequest) -> Tuple[int, FaceAnalysisResponse]:
+    """Analyze one batch item, waiting for a background slot instead of failing"""
+    async with background_slots:
+        start_time = time.time()
+        image_data = [img.data for img in item.images]
+        
+        try:
+            check_request(image_data)
+            analysis_result = await analyze_when_admitted(image_data)
+            
+            processing_time = int((time.time() - start_time) * 1000)
+            return index, build_analysis_response(analysis_result, len(image_data), processing_time)
+            
+        except Exception as e:
+            logger.error(f"Unexpected error during batch item {index} analysis: {e}")
+            processing_time = int((time.time() - start_time) * 1000)
+            return index, analysis_failure_response(f"Analysis failed: {str(e)}", len(image_data), processing_time)
+
+async def stream_batch_results(items: List[FaceAnalysisRequest], http_request: Request):
+    """Yield NDJSON result lines in completion order, then bulk-store the records"""
+    # Items wait on the shared background slots, so concurrent batches never crowd out
+    # interactive requests
+    tasks = [asyncio.create_task(analyze_batch_item(i, item)) for i, item in enumerate(items)]
+    records = []
+    
+    logger.info(f"Starting batch face analysis for {len(items)} items")
+    
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, response = await next_done
+            analysis_stats.record(response)
+            REQUESTS_TOTAL.inc(1, "batch", "success" if response.success else "failure")
+            
+            if response.success:
+                records.append(build_analysis_record(
+                    response, items[index].session_id,
+                    http_request.client.host, http_request.headers.get("user-agent")
+                ).dict())
+            
+            line = {"index": index, "session_id": items[index].session_id, **jsonable_encoder(response)}
+            yield json.dumps(line) + "\n"
+    finally:
+        # Client went away: stop analyzing the remaining items
+        for task in tasks:
+            task.cancel()
+    
+    stored = 0
+    if records:
+        try:
+            result = await db.face_analyses.insert_many(records, ordered=False)
+            stored = len(result.inserted_ids)
+            logger.info(f"Stored {stored} batch analysis records")
+        except BulkWriteError as e:
+            # Unordered, so every record the server did not reject was stored
+            stored = e.details.get("nInserted", 0)
+            logger.error(f"Stored {stored} of {len(records)} batch analysis records: {e}")
+        except Exception as e:
+            logger.error(f"Error storing batch analysis records: {e}")
+    
+    yield json.dumps({"done": True, "total": len(items), "successful": len(records), "stored": stored}) + "\n"
 
 @router.get("/stats")
 async def get_analysis_stats():
     """Get analysis statistics"""
     try:
-        # Get total count
-        total_count = await db.face_analyses.count_documents({})
-        
-        # Get successful analyses
-        successful_count = await db.face_analyses.count_documents({"colors": {"$exists": True}})
-        
-        # Get recent analyses for common colors
-        recent_analyses = await db.face_analyses.find(
-            {"colors": {"$exists": True}},
-            {"colors": 1}
-        ).limit(100).to_list(100)
-        
-        skin_tones = [analysis["colors"]["skin_tone"] for analysis in recent_analyses]
-        eye_colors = [analysis["colors"]["eye_color"] for analysis in recent_analyses]
-        
-        # Get most common colors (simple approach)
-        from collections import Counter
-        common_skin_tones = [color for color, count in Counter(skin_tones).most_common(5)]
-        common_eye_colors = [color for color, count in Counter(eye_colors).most_common(5)]
-        
-        return {
-            "total_analyses": total_count,
-            "successful_analyses": successful_count,
-            "failed_analyses": total_count - successful_count,
-            "success_rate": (successful_count / total_count * 100) if total_count > 0 else 0,
-            "most_common_skin_tones": common_skin_tones,
-            "most_common_eye_colors": common_eye_colors
-        }
+        return await analysis_stats.snapshot()
         
     except Exception as e:
         logger.error(f"Error getting analysis stats: {e}")
         raise HTTPException(status_code=500, detail="Failed to get analysis statistics")
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters of the per-image analysis result cache"""
+    lookups = analysis_executor.cache_hits + analysis_executor.cache_misses
+    return {
+        "hits": analysis_executor.cache_hits,
+        "misses": analysis_executor.cache_misses,
+        "hit_rate": (analysis_executor.cache_hits / lookups * 100) if lookups > 0 else 0
+    }
+
+@router.get("/storage/stats")
+async def get_storage_stats():
+    """Get counters of the write-behind analysis record buffer"""
+    return record_writer.stats()
+
 @router.get("/history/{session_id}")
-async def get_analysis_history(session_id: str):
-    """Get analysis history for a specific session"""
+async def get_analysis_history(
+    session_id: str,
+    limit: int = Query(default=10, ge=1, le=100, description="Maximum records to return"),
+    after: Optional[str] = Query(default=None, description="Cursor from a previous page's next_cursor"),
+    fields: Optional[str] = Query(default=None, description="Comma-separated record fields to return")
+):
+    """Get analysis history for a specific session, newest first, one page at a time"""
     try:
-        analyses = await db.face_analyses.find(
-            {"session_id": session_id},
-            {"_id": 0}
-        ).sort("created_at", -1).to_list(10)
+        query = history_filter(session_id, after)
+        projection = history_projection(
+            [field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+            list(AnalysisRecord.__fields__)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # One extra record tells us whether another page exists
+        analyses = await db.face_analyses.find(query, projection).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+        
+        next_cursor = None
+        if len(analyses) > limit:
+            analyses = analyses[:limit]
+            next_cursor = encode_cursor(analyses[-1])
         
         return {
             "session_id": session_id,
             "analyses": analyses,
-            "count": len(analyses)
+            "count": len(analyses),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
         logger.error(f"Error getting analysis history: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get analysis history")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to get analysis history")
@@ -0,0 +1,153 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Any, Dict
+import json
+import logging
+import time
+
+from models.analysis import AnalysisJob, FaceAnalysisRequest
+from routes.analysis import (
+    analysis_executor,
+    analysis_failure_response,
+    analysis_stats,
+    analyze_when_admitted,
+    background_slots,
+    build_analysis_record,
+    build_analysis_response,
+    db,
+    record_writer
+)
+from services.ingestion import ImageTooLarge, check_request
+from services.job_queue import TERMINAL_STATUSES, AnalysisJobQueue, JobQueueFull
+from services.metrics import REQUEST_SECONDS, REQUESTS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/analysis/jobs", tags=["analysis"])
+
+# Seconds between job state checks on an SSE stream, and between keep-alive comments
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_KEEPALIVE_INTERVAL = 15
+
+
+async def run_analysis_job(job: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze a queued job's images and store the record, returning the response body"""
+    image_data = payload["images"]
+
+    # Jobs share the background slots with batch items
+    async with background_slots:
+        start_time = time.time()
+        try:
+            analysis_result = await analyze_when_admitted(image_data)
+            processing_time = int((time.time() - start_time) * 1000)
+            response = build_analysis_response(analysis_result, len(image_data), processing_time)
+        except Exception as e:
+            logger.error(f"Unexpected error during job {job['id']} analysis: {e}")
+            processing_time = int((time.time() - start_time) * 1000)
+            response = analysis_failure_response(f"Analysis failed: {str(e)}", len(image_data), processing_time)
+
+    analysis_stats.record(response)
+    REQUESTS_TOTAL.inc(1, "jobs", "success" if response.success else "failure")
+    REQUEST_SECONDS.observe(time.time() - start_time, "jobs")
+    if response.success:
+        record_writer.add(build_analysis_record(
+            response, job["session_id"], payload["ip_address"], payload["user_agent"]
+        ).dict())
+
+    return jsonable_encoder(response)
+
+
+# One consumer per analysis worker; background_slots keeps jobs from starving interactive requests
+job_queue = AnalysisJobQueue(
+    db.analysis_jobs,
+    run_analysis_job,
+    concurrency=analysis_executor.max_workers
+)
+
+
+@router.post("", status_code=202)
+async def submit_analysis_job(request: FaceAnalysisRequest, http_request: Request):
+    """
+    Queue a face analysis and return its job ID immediately.
+
+    Poll ``/analysis/jobs/{job_id}`` or subscribe to ``/analysis/jobs/{job_id}/events``
+    for the result. Returns 429 with Retry-After when the queue is full, and
+    413 when the images exceed the ingestion limits.
+    """
+    try:
+        check_request([img.data for img in request.images])
+    except ImageTooLarge as e:
+        REQUESTS_TOTAL.inc(1, "jobs", "rejected")
+        raise HTTPException(status_code=413, detail=str(e))
+
+    job = AnalysisJob(session_id=request.session_id, total_images=len(request.images))
+    payload = {
+        "images": [img.data for img in request.images],
+        "ip_address": http_request.client.host,
+        "user_agent": http_request.headers.get("user-agent")
+    }
+
+    try:
+        await job_queue.submit(job.dict(), payload)
+    except JobQueueFull as e:
+        logger.warning(f"Rejecting analysis job: {e}")
+        REQUESTS_TOTAL.inc(1, "jobs", "rejected")
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many queued analyses, please retry later"},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except Exception as e:
+        logger.error(f"Error submitting analysis job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to submit analysis job")
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "poll_url": f"{http_request.url.path}/{job.id}",
+        "events_url": f"{http_request.url.path}/{job.id}/events"
+    }
+
+
+@router.get("/{job_id}", response_model=AnalysisJob)
+async def get_analysis_job(job_id: str):
+    """Get the current state of an analysis job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def stream_analysis_job_events(job_id: str):
+    """Server-sent events with the job state on every change, ending once it completes or fails"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+
+    async def events():
+        current = job
+        last_status = None
+        last_sent = time.monotonic()
+
+        while True:
+            if current is not None and current["status"] != last_status:
+                last_status = current["status"]
+                last_sent = time.monotonic()
+                yield f"event: {last_status}\ndata: {json.dumps(jsonable_encoder(current))}\n\n"
+                if last_status in TERMINAL_STATUSES:
+                    return
+            elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE_INTERVAL:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+            # Jobs running in this process wake us up directly; others are picked up by polling
+            await job_queue.wait_for_update(job_id, EVENTS_POLL_INTERVAL)
+            current = await job_queue.get(job_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import logging
+import time
+
+from models.analysis import PresenceResponse
+from services.metrics import REQUESTS_TOTAL, STAGE_SECONDS
+from services.presence_detector import POSES, FacePresenceDetector, PresenceDetectorBusy
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/analysis", tags=["analysis"])
+
+# Frames are meant to be downscaled by the client; anything bigger is not a preview frame
+PRESENCE_MAX_FRAME_BYTES = 512 * 1024
+
+presence_detector = FacePresenceDetector()
+
+# Own threads, so presence checks never queue behind analyses or streams
+presence_pool = ThreadPoolExecutor(max_workers=presence_detector.size, thread_name_prefix='presence')
+
+
+@router.post("/presence", response_model=PresenceResponse)
+async def check_presence(
+    image: UploadFile = File(..., description="Downscaled preview frame (JPEG or PNG)"),
+    step: Optional[int] = Form(default=None, ge=0, le=2, description="Capture step to check the pose against")
+):
+    """
+    Quick face presence and pose check for live capture guidance.
+
+    Runs a lightweight face detector on a heavily downscaled frame and returns
+    whether a face is visible, its bounding box, a rough yaw and the matching
+    capture pose, meant to be polled several times per second. Returns 503
+    when every detector is busy; just poll again.
+    """
+    start_time = time.perf_counter()
+    frame = await image.read()
+    if len(frame) > PRESENCE_MAX_FRAME_BYTES:
+        raise HTTPException(status_code=413, detail="Preview frame is too large, send a downscaled frame")
+
+    try:
+        if presence_detector.busy:
+            raise PresenceDetectorBusy("All presence detectors are busy")
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(presence_pool, presence_detector.check, frame)
+    except PresenceDetectorBusy:
+        REQUESTS_TOTAL.inc(1, "presence", "rejected")
+        raise HTTPException(status_code=503, detail="Presence check is busy", headers={"Retry-After": "1"})
+    except ValueError as e:
+        REQUESTS_TOTAL.inc(1, "presence", "error")
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if step is not None and result['face_detected']:
+        result['step_ok'] = result['pose'] == POSES[step]
+
+    elapsed = time.perf_counter() - start_time
+    STAGE_SECONDS.observe(elapsed, 'presence', '')
+    REQUESTS_TOTAL.inc(1, "presence", "face" if result['face_detected'] else "no_face")
+    return PresenceResponse(processing_time_ms=round(elapsed * 1000, 1), **result)
@@ -0,0 +1,114 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+from routes.analysis import analysis_stats, build_analysis_record, build_analysis_response, record_writer
+from services.metrics import REQUESTS_TOTAL, STAGE_SECONDS, record_analysis
+from services.stream_session import create_stream_session
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/analysis", tags=["analysis"])
+
+# Every stream owns a FaceMesh graph, so cap how many run at once
+STREAM_MAX_SESSIONS = int(os.environ.get('STREAM_MAX_SESSIONS', 0)) or os.cpu_count() or 1
+STREAM_MAX_FRAME_BYTES = int(os.environ.get('STREAM_MAX_FRAME_BYTES', 1024 * 1024))
+
+# WebSocket close code for "try again later"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+_active_streams = 0
+
+
+@router.websocket("/stream")
+async def stream_analysis(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Analyze a live stream of downscaled frames and push a refined estimate after each one.
+
+    Send each frame as a binary message (encoded JPEG/PNG) or as a text message
+    holding base64 or a data URL, and wait for its reply before sending the
+    next. Every reply carries ``frame``, ``face_detected``, ``colors`` (the
+    estimate so far, null until a face was seen), ``stability`` (0-1) and
+    ``converged``; stop streaming once ``converged`` is true. The final
+    estimate is stored like any other analysis when the client disconnects.
+    """
+    global _active_streams
+    await websocket.accept()
+    if _active_streams >= STREAM_MAX_SESSIONS:
+        logger.warning(f"Rejecting analysis stream, {_active_streams} already open")
+        REQUESTS_TOTAL.inc(1, "stream", "rejected")
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Too many analysis streams, retry shortly")
+        return
+
+    _active_streams += 1
+    start_time = time.time()
+    session = None
+    try:
+        # Building the FaceMesh graph takes a while, keep it off the event loop
+        session = await asyncio.to_thread(create_stream_session)
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame = message.get("bytes") if message.get("bytes") is not None else message.get("text")
+            if not frame:
+                continue
+            if len(frame) > STREAM_MAX_FRAME_BYTES:
+                await websocket.send_json({
+                    "frame": session.frames,
+                    "error": f"Frame exceeds {STREAM_MAX_FRAME_BYTES} bytes, send a downscaled frame"
+                })
+                continue
+
+            frame_start = time.perf_counter()
+            update = await asyncio.to_thread(session.process_frame, frame)
+            STAGE_SECONDS.observe(time.perf_counter() - frame_start, 'frame', '')
+            record_analysis(update)
+
+            await websocket.send_json({
+                key: value for key, value in update.items() if key not in ('image_outcomes', 'timings')
+            })
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error during analysis stream: {e}")
+        try:
+            await websocket.close(code=1011, reason="Analysis stream failed")
+        except RuntimeError:
+            # The client is already gone
+            pass
+    finally:
+        _active_streams -= 1
+        if session is not None:
+            session.close()
+            finish_stream(session, session_id, websocket, start_time)
+
+
+def finish_stream(session, session_id: Optional[str], websocket: WebSocket, start_time: float):
+    """Count the stream and store its final estimate as an analysis record"""
+    processing_time = int((time.time() - start_time) * 1000)
+    if session.colors is None:
+        REQUESTS_TOTAL.inc(1, "stream", "failure")
+        return
+
+    response = build_analysis_response({
+        'success': True,
+        'results': session.colors,
+        'images_analyzed': session.faces,
+        'total_images': session.frames
+    }, session.frames, processing_time)
+    response.metadata.algorithm = "MediaPipe tracking + K-means clustering"
+    analysis_stats.record(response)
+    REQUESTS_TOTAL.inc(1, "stream", "success")
+
+    record_writer.add(build_analysis_record(
+        response, session_id, websocket.client.host if websocket.client else None,
+        websocket.headers.get("user-agent")
+    ).dict())
+    logger.info(f"Analysis stream finished after {session.frames} frames "
+                f"(stability {session.stability:.2f}, converged: {session.converged})")
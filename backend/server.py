@@ -1,31 +1,85 @@
-from fastapi import FastAPI, APIRouter
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import logging
-from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List
 import uuid
 from datetime import datetime
 
 # Import analysis routes
-from routes.analysis import router as analysis_router
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from routes.analysis import router as analysis_router, admission, analysis_executor, analysis_stats, record_writer
+from routes.jobs import router as jobs_router, job_queue
+from routes.presence import router as presence_router, presence_detector, presence_pool
+from routes.stream import router as stream_router
+from services.analysis_history import ensure_indexes
+from services.database import client, db
+from services.ingestion import MAX_BATCH_BODY_BYTES, RequestSizeLimitMiddleware
+from services.metrics import registry
+
+# Backoff between attempts of a failed startup step, doubling up to the maximum
+STARTUP_RETRY_DELAY = 1.0
+STARTUP_MAX_RETRY_DELAY = 30.0
+
+async def retry_with_backoff(step, description: str):
+    """Await ``step()`` until it succeeds, so a startup failure never needs a manual restart"""
+    delay = STARTUP_RETRY_DELAY
+    while True:
+        try:
+            return await step()
+        except Exception as e:
+            logger.error(f"Error {description}, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_MAX_RETRY_DELAY)
+
+async def prepare_storage():
+    """Create the indexes and load the running stats; slow while Mongo is unreachable"""
+    await ensure_indexes(db)
+    await analysis_stats.load()
+
+async def warm_up_analyzers():
+    await analysis_executor.warm_up()
+    await asyncio.get_running_loop().run_in_executor(presence_pool, presence_detector.warm_up)
+
+async def warm_up_models(app: FastAPI):
+    """Prepare storage and warm every analyzer, retrying each, then mark the app ready to take traffic"""
+    await asyncio.gather(
+        retry_with_backoff(prepare_storage, "setting up storage"),
+        retry_with_backoff(warm_up_analyzers, "warming up analysis models")
+    )
+    app.state.models_ready = True
+    logger.info("Analysis models are warm, ready for traffic")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the app's shared resources: storage setup, model warm-up and orderly shutdown"""
+    app.state.models_ready = False
+    # Storage setup and warm-up run in the background, so /api/health answers right
+    # away (even with Mongo unreachable) and /api/ready answers not ready meanwhile
+    warm_up = asyncio.create_task(warm_up_models(app))
+    
+    yield
+    
+    app.state.models_ready = False
+    warm_up.cancel()
+    with suppress(asyncio.CancelledError):
+        await warm_up
+    await job_queue.stop()
+    analysis_executor.shutdown()
+    presence_pool.shutdown(wait=False, cancel_futures=True)
+    # Buffered writes go out before the shared client closes
+    await record_writer.stop()
+    await analysis_stats.stop()
+    client.close()
 
 # Create the main app without a prefix
 app = FastAPI(
     title="Face Color Analyzer API",
     description="AI-powered facial feature color analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Create a router with the /api prefix
@@ -53,6 +107,18 @@ async def health_check():
         "service": "face-color-analyzer"
     }
 
+@api_router.get("/ready")
+async def readiness_check(request: Request):
+    """Readiness probe: 200 once storage is set up and the analysis models are warm, 503 until then"""
+    if not getattr(request.app.state, "models_ready", False):
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms and analysis counters"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
@@ -65,12 +131,33 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+# Point-in-time values read whenever /api/metrics is scraped
+registry.gauge("face_analysis_executor_pending", "Analyses running or waiting for a worker",
+               lambda: analysis_executor.pending)
+registry.gauge("face_analysis_admission_active", "Interactive analyses holding an admission slot",
+               lambda: admission.active)
+registry.gauge("face_analysis_admission_waiting", "Interactive analyses waiting for an admission slot",
+               lambda: admission.waiting)
+registry.gauge("face_analysis_jobs_queued", "Analysis jobs waiting to start",
+               lambda: job_queue.queued)
+registry.gauge("face_analysis_records_pending", "Analysis records buffered for writing",
+               lambda: record_writer.pending)
+
 # Include analysis routes
 api_router.include_router(analysis_router)
+api_router.include_router(jobs_router)
+api_router.include_router(stream_router)
+api_router.include_router(presence_router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Oversized analysis bodies are refused while they arrive, before they are parsed
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    overrides={"/api/analysis/analyze-face/batch": MAX_BATCH_BODY_BYTES}
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -85,7 +172,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import math
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from services.metrics import ADMISSION_WAIT_SECONDS, ADMISSIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Request header carrying how many milliseconds the client is willing to wait
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot start before its deadline; retry after ``retry_after`` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue and deadline-aware shedding
+
+    At most ``concurrency`` requests run at once and at most ``max_waiting``
+    wait for a slot, in arrival order. Every request brings a deadline; one
+    that cannot start before it is rejected up front instead of joining the
+    queue: when the queue is full, or when the expected wait (the requests
+    ahead of it times the moving average run time, spread over the slots)
+    already passes the deadline. A request whose deadline runs out while it
+    waits leaves the queue. Shedding early keeps queued requests fresh,
+    rather than serving requests whose clients have already given up.
+
+    Configuration (environment):
+        ADMISSION_CONCURRENCY          requests analyzed at once (default: ``default_concurrency``)
+        ADMISSION_QUEUE_SIZE           requests waiting for a slot (default: 4 per slot)
+        ADMISSION_DEFAULT_DEADLINE_MS  deadline of requests without the header (default 10000)
+        ADMISSION_MAX_DEADLINE_MS      cap on client deadlines (default 60000)
+    """
+
+    def __init__(self, default_concurrency: Optional[int] = None, max_waiting: Optional[int] = None,
+                 default_deadline: Optional[float] = None, max_deadline: Optional[float] = None):
+        self.concurrency = (
+            int(os.environ.get('ADMISSION_CONCURRENCY', 0))
+            or default_concurrency
+            or os.cpu_count()
+            or 1
+        )
+        self.max_waiting = max_waiting or int(os.environ.get('ADMISSION_QUEUE_SIZE', 0)) or self.concurrency * 4
+        self.default_deadline = (
+            default_deadline or int(os.environ.get('ADMISSION_DEFAULT_DEADLINE_MS', 10000)) / 1000
+        )
+        self.max_deadline = max_deadline or int(os.environ.get('ADMISSION_MAX_DEADLINE_MS', 60000)) / 1000
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long an admitted request holds its slot
+        self._avg_duration = 1.0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def timeout_from_header(self, value: Optional[str]) -> float:
+        """Seconds the client will wait, from the deadline header or the default"""
+        try:
+            milliseconds = float(value)
+        except (TypeError, ValueError):
+            return self.default_deadline
+        if not 0 < milliseconds < math.inf:
+            return self.default_deadline
+        return min(milliseconds / 1000, self.max_deadline)
+
+    def expected_wait(self, ahead: int) -> float:
+        """Seconds until a slot frees up for a request with ``ahead`` requests before it"""
+        return self._avg_duration * (ahead + 1) / self.concurrency
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait(len(self._waiters))))
+
+    @asynccontextmanager
+    async def admit(self, timeout: float):
+        """Hold a slot for the body of the ``async with``, or raise AdmissionRejected
+
+        ``timeout`` is how long from now the request may wait to start.
+        """
+        loop = asyncio.get_running_loop()
+        arrived = loop.time()
+        await self._acquire(arrived + timeout)
+        started = loop.time()
+        ADMISSIONS_TOTAL.inc(1, "admitted")
+        ADMISSION_WAIT_SECONDS.observe(started - arrived)
+        try:
+            yield started - arrived
+        finally:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * (loop.time() - started)
+            self._release()
+
+    async def _acquire(self, deadline: float):
+        loop = asyncio.get_running_loop()
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        if len(self._waiters) >= self.max_waiting:
+            ADMISSIONS_TOTAL.inc(1, "queue_full")
+            raise AdmissionRejected(f"Admission queue is full ({len(self._waiters)} waiting)", self.retry_after())
+
+        expected = self.expected_wait(len(self._waiters))
+        if loop.time() + expected > deadline:
+            ADMISSIONS_TOTAL.inc(1, "deadline")
+            raise AdmissionRejected(f"Expected wait of {expected:.2f}s exceeds the deadline", self.retry_after())
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            # A slot released to this waiter is handed over with the result
+            await asyncio.wait_for(waiter, deadline - loop.time())
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over in the same loop turn the deadline passed
+                # (wait_for still times out then on Python 3.12+); take it
+                return
+            self._forget(waiter)
+            ADMISSIONS_TOTAL.inc(1, "timed_out")
+            raise AdmissionRejected("Deadline passed while waiting for an analysis slot", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived just as the request was cancelled, pass it on
+                self._release()
+            else:
+                self._forget(waiter)
+            raise
+
+    def _forget(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter, so nobody can overtake the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
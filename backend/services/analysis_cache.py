@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pipeline changes in a way that invalidates cached results
+CACHE_VERSION = 2
+
+
+class AnalysisCache:
+    """Content-addressed cache of single-image analysis results
+
+    A result holds each region's sampled pixels rather than final colors, so
+    cached images can still be pooled with new ones; entries are a few tens
+    of KiB with the default ANALYSIS_REGION_SAMPLES.
+
+    Entries are keyed by a hash of the encoded image bytes plus the analyzer
+    configuration. An in-memory LRU with a TTL answers repeated images in the
+    same process; an optional shared Mongo collection (with a TTL index, see
+    analysis_history.INDEXES) lets every worker reuse results computed
+    elsewhere. After a failed shared lookup or write the shared tier is
+    skipped for ``shared_cooldown`` seconds, so while Mongo is down a miss
+    costs one analysis rather than a server selection timeout on top.
+
+    Configuration (environment):
+        ANALYSIS_CACHE_SIZE    max in-memory entries (default 1024, 0 disables the cache)
+        ANALYSIS_CACHE_TTL     entry lifetime in seconds (default 3600)
+        ANALYSIS_CACHE_SHARED  "true" to also use the shared Mongo collection
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 3600, shared_collection=None,
+                 shared_cooldown: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared_collection = shared_collection
+        self.shared_cooldown = shared_cooldown
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared_skip_until = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, config: str) -> str:
+        """Hash of the image content and the analyzer configuration"""
+        digest = hashlib.blake2b(image_bytes, digest_size=20)
+        digest.update(f"|{config}|v{CACHE_VERSION}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for ``key`` or None, counting hits and misses"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._get_shared(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                self._store(key, value, now)
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, key: str, value: Dict):
+        """Store a result in memory and, if configured, in the shared collection"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        self._set_shared(key, value)
+
+    def _store(self, key: str, value: Dict, now: float):
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _shared_available(self) -> bool:
+        return self.shared_collection is not None and time.monotonic() >= self._shared_skip_until
+
+    def _shared_failed(self, action: str, error: Exception):
+        self._shared_skip_until = time.monotonic() + self.shared_cooldown
+        logger.warning(f"Shared analysis cache {action} failed, skipping it for {self.shared_cooldown:.0f}s: {error}")
+
+    def _get_shared(self, key: str) -> Optional[Dict]:
+        if not self._shared_available():
+            return None
+        try:
+            doc = self.shared_collection.find_one({"_id": key}, {"result": 1, "created_at": 1})
+            # The TTL monitor only runs once a minute, so check expiry here too
+            if doc and (datetime.utcnow() - doc["created_at"]).total_seconds() < self.ttl_seconds:
+                return doc["result"]
+        except Exception as e:
+            self._shared_failed("lookup", e)
+        return None
+
+    def _set_shared(self, key: str, value: Dict):
+        if not self._shared_available():
+            return
+        try:
+            self.shared_collection.replace_one(
+                {"_id": key},
+                {"_id": key, "result": value, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            self._shared_failed("write", e)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+def shared_cache_enabled() -> bool:
+    """Whether the environment turns on the shared Mongo tier"""
+    return (
+        int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024)) > 0
+        and os.environ.get('ANALYSIS_CACHE_SHARED', '').lower() in ('1', 'true', 'yes')
+    )
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Build the cache configured by the environment"""
+    max_entries = int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024))
+    ttl_seconds = int(os.environ.get('ANALYSIS_CACHE_TTL', 3600))
+
+    shared_collection = None
+    if shared_cache_enabled():
+        from pymongo import MongoClient
+        client = MongoClient(os.environ['MONGO_URL'], serverSelectionTimeoutMS=2000)
+        shared_collection = client[os.environ['DB_NAME']].analysis_cache
+
+    return AnalysisCache(max_entries=max_entries, ttl_seconds=ttl_seconds,
+                         shared_collection=shared_collection)
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from contextlib import ExitStack
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Union
+
+from services.analyzer_pool import AnalyzerPool, AnalyzerPoolTimeout
+from services.metrics import record_analysis
+
+logger = logging.getLogger(__name__)
+
+# Analyzers owned by the current pool process, created once by _init_worker
+_worker_analyzer = None
+_worker_helpers: List = []
+_worker_fan_out: Optional[ThreadPoolExecutor] = None
+_worker_warm = False
+
+
+def _init_worker(parallelism: int = 1):
+    """Build the per-process FaceAnalyzer (and its FaceMesh graph)
+
+    With ``parallelism`` above 1 the process also gets helper analyzers and a
+    thread pool to analyze one request's images concurrently.
+    """
+    global _worker_analyzer, _worker_helpers, _worker_fan_out
+    from services.face_analyzer import FaceAnalyzer
+    _worker_analyzer = FaceAnalyzer()
+    if parallelism > 1:
+        _worker_helpers = [
+            FaceAnalyzer(color_engine=_worker_analyzer.color_engine, cache=_worker_analyzer.cache)
+            for _ in range(parallelism - 1)
+        ]
+        _worker_fan_out = ThreadPoolExecutor(max_workers=parallelism - 1, thread_name_prefix='analysis-fan-out')
+
+
+def _analyze_in_worker(images: List[Union[str, bytes]], time_budget: Optional[float] = None) -> Dict:
+    """Run the full multi-image analysis inside a pool process"""
+    return _worker_analyzer.analyze_multiple_images(images, _worker_fan_out, _worker_helpers, time_budget)
+
+
+def _warm_up_worker() -> int:
+    """Warm the current pool process's analyzers, returning the process ID"""
+    global _worker_warm
+    if not _worker_warm:
+        for analyzer in [_worker_analyzer, *_worker_helpers]:
+            analyzer.warm_up()
+        _worker_warm = True
+    return os.getpid()
+
+
+def _analyze_in_thread(analyzers: AnalyzerPool, images: List[Union[str, bytes]],
+                       fan_out: Optional[ThreadPoolExecutor] = None, parallelism: int = 1,
+                       time_budget: Optional[float] = None) -> Dict:
+    """Run the full multi-image analysis on pooled analyzers from the current thread
+
+    Up to ``parallelism - 1`` extra analyzers are borrowed for the request, but
+    only ones that are idle right now, so a busy pool falls back to analyzing
+    the images one after another instead of making requests wait on each other.
+    """
+    with analyzers.acquire() as analyzer, ExitStack() as borrowed:
+        helpers = []
+        if fan_out is not None:
+            for _ in range(min(parallelism, len(images)) - 1):
+                try:
+                    helpers.append(borrowed.enter_context(analyzers.acquire(timeout=0)))
+                except AnalyzerPoolTimeout:
+                    break
+        return analyzer.analyze_multiple_images(images, fan_out if helpers else None, helpers, time_budget)
+
+
+class AnalysisQueueFull(Exception):
+    """Raised when the executor has no capacity for another analysis right now
+
+    Either it already holds its maximum number of pending analyses, or (in
+    thread mode with ANALYZER_POOL_TIMEOUT) no pooled analyzer freed up in time.
+    """
+
+
+class AnalysisExecutor:
+    """Runs face analysis off the event loop, in worker processes or threads
+
+    Process mode gives every worker its own interpreter and analyzer. Thread
+    mode shares one process and checks out analyzers from an AnalyzerPool;
+    OpenCV, NumPy and MediaPipe release the GIL for the heavy work, so it
+    scales with cores at a fraction of the memory.
+
+    ANALYSIS_PARALLELISM opts into analyzing one request's images (and then
+    clustering its regions) concurrently, on up to that many analyzers and
+    threads per request. Process workers each get that many analyzers; thread
+    mode sizes the analyzer pool for it and lends the extra analyzers out only
+    while they are idle.
+
+    Configuration (environment):
+        ANALYSIS_EXECUTOR     "process" (default) or "thread"
+        ANALYSIS_WORKERS      number of worker processes or threads (default: CPU count)
+        ANALYSIS_QUEUE_DEPTH  max analyses running or waiting (default: 4 per worker)
+        ANALYSIS_PARALLELISM  analyzers/threads per request (default 1, sequential)
+        ANALYZER_POOL_SIZE    thread mode analyzers, below the thread count to cap memory
+                              (default: one per thread and parallel analysis)
+        ANALYZER_POOL_TIMEOUT thread mode wait for a free analyzer before the analysis is
+                              rejected like a full queue (default: block)
+    """
+
+    MODES = ('process', 'thread')
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue_depth: Optional[int] = None,
+                 mode: Optional[str] = None, parallelism: Optional[int] = None):
+        self.mode = (mode or os.environ.get('ANALYSIS_EXECUTOR', 'process')).lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown analysis executor mode '{self.mode}', expected one of {self.MODES}")
+        self.max_workers = max_workers or int(os.environ.get('ANALYSIS_WORKERS', 0)) or os.cpu_count() or 1
+        self.max_queue_depth = (
+            max_queue_depth
+            or int(os.environ.get('ANALYSIS_QUEUE_DEPTH', 0))
+            or self.max_workers * 4
+        )
+        self.parallelism = max(parallelism or int(os.environ.get('ANALYSIS_PARALLELISM', 1)), 1)
+        self._pool: Optional[Executor] = None
+        self._analyzers: Optional[AnalyzerPool] = None
+        self._fan_out: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        # Result cache counters reported back by the workers
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of analyses currently running or waiting for a worker"""
+        return self._pending
+
+    def _get_pool(self) -> Executor:
+        # Created lazily so importing the routes never spawns processes or builds graphs
+        if self._pool is None:
+            logger.info(f"Starting analysis pool with {self.max_workers} worker {self.mode}s, "
+                        f"{self.parallelism} analyzer(s) per request")
+            if self.mode == 'thread':
+                self._analyzers = AnalyzerPool(
+                    size=int(os.environ.get('ANALYZER_POOL_SIZE', 0)) or self.max_workers * self.parallelism
+                )
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='analysis'
+                )
+                if self.parallelism > 1:
+                    self._fan_out = ThreadPoolExecutor(
+                        max_workers=self.max_workers * (self.parallelism - 1),
+                        thread_name_prefix='analysis-fan-out'
+                    )
+            else:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.parallelism,)
+                )
+        return self._pool
+
+    async def warm_up(self):
+        """Start every worker and run its analyzer once on a synthetic frame"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        if self.mode == 'thread':
+            await loop.run_in_executor(pool, self._analyzers.warm_up)
+            return
+
+        # Workers are spawned on demand, so keep submitting until each one has warmed up
+        warmed = set()
+        try:
+            for _ in range(3):
+                pids = await asyncio.gather(*[
+                    loop.run_in_executor(pool, _warm_up_worker) for _ in range(self.max_workers)
+                ])
+                warmed.update(pids)
+                if len(warmed) >= self.max_workers:
+                    break
+        except BrokenProcessPool:
+            # Drop the pool so that warming up again starts a fresh one
+            logger.error("Analysis worker pool broke while warming up")
+            self.shutdown()
+            raise
+        logger.info(f"Warmed up {len(warmed)} analysis worker processes")
+
+    async def analyze_multiple_images(self, images: List[Union[str, bytes]],
+                                      time_budget: Optional[float] = None) -> Dict:
+        """Analyze images (base64 strings or raw bytes) in a worker process or thread
+        
+        ``time_budget`` is the seconds after which the analysis starts no new
+        image once it runs (see FaceAnalyzer.analyze_multiple_images).
+        """
+        if self._pending >= self.max_queue_depth:
+            raise AnalysisQueueFull(
+                f"Analysis queue is full ({self._pending}/{self.max_queue_depth} pending)"
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            if self.mode == 'thread':
+                result = await loop.run_in_executor(
+                    pool, _analyze_in_thread, self._analyzers, images, self._fan_out, self.parallelism, time_budget
+                )
+            else:
+                result = await loop.run_in_executor(pool, _analyze_in_worker, images, time_budget)
+            self.cache_hits += result.get('cache_hits', 0)
+            self.cache_misses += result.get('cache_misses', 0)
+            record_analysis(result)
+            return result
+        except AnalyzerPoolTimeout as e:
+            # Out of capacity like a full queue: the caller retries, it is not a failed analysis
+            raise AnalysisQueueFull(str(e)) from e
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); drop the pool so the next call starts a fresh one
+            logger.error("Analysis worker pool is broken, restarting on next request")
+            self.shutdown()
+            raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        """Stop the worker processes or threads"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._analyzers = None
+        if self._fan_out is not None:
+            self._fan_out.shutdown(wait=False, cancel_futures=True)
+            self._fan_out = None
+
+
+class QueuedAnalysisExecutor:
+    """Hands analyses to standalone analyzer workers through the Mongo work queue
+
+    Used when ANALYSIS_EXECUTOR is "queue": the API process only enqueues and
+    awaits, and ``analysis_worker.py`` processes on any number of nodes do the
+    analysis, so analysis capacity scales apart from HTTP capacity. Keeps the
+    AnalysisExecutor interface, including its cap on pending analyses.
+
+    Configuration (environment):
+        ANALYSIS_WORKERS      analyses batches and jobs keep in flight (default: CPU count)
+        ANALYSIS_QUEUE_DEPTH  max analyses this process waits on (default: 4 per worker)
+        WORK_QUEUE_*          see AnalysisWorkQueue
+    """
+
+    mode = 'queue'
+
+    def __init__(self, work_queue, max_workers: Optional[int] = None, max_queue_depth: Optional[int] = None):
+        self.work_queue = work_queue
+        self.max_workers = max_workers or int(os.environ.get('ANALYSIS_WORKERS', 0)) or os.cpu_count() or 1
+        self.max_queue_depth = (
+            max_queue_depth
+            or int(os.environ.get('ANALYSIS_QUEUE_DEPTH', 0))
+            or self.max_workers * 4
+        )
+        self._pending = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of analyses enqueued by this process and not finished yet"""
+        return self._pending
+
+    async def warm_up(self):
+        """Nothing to warm in the API process, the workers warm their own analyzers"""
+        logger.info("Analysis runs on queue workers, no local analyzers to warm up")
+
+    async def analyze_multiple_images(self, images: List[Union[str, bytes]],
+                                      time_budget: Optional[float] = None) -> Dict:
+        """Enqueue the images and wait for a worker's result"""
+        if self._pending >= self.max_queue_depth:
+            raise AnalysisQueueFull(
+                f"Analysis queue is full ({self._pending}/{self.max_queue_depth} pending)"
+            )
+
+        self._pending += 1
+        try:
+            task_id = await self.work_queue.enqueue(images, time_budget)
+            result = await self.work_queue.wait(task_id)
+            self.cache_hits += result.get('cache_hits', 0)
+            self.cache_misses += result.get('cache_misses', 0)
+            record_analysis(result)
+            return result
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        """Nothing to stop; queued tasks stay in Mongo for the workers"""
+
+
+def create_analysis_executor():
+    """The executor selected by ANALYSIS_EXECUTOR ("process", "thread" or "queue")"""
+    if os.environ.get('ANALYSIS_EXECUTOR', 'process').lower() == 'queue':
+        from services.database import db
+        from services.work_queue import AnalysisWorkQueue
+        return QueuedAnalysisExecutor(AnalysisWorkQueue(db.analysis_work))
+    return AnalysisExecutor()
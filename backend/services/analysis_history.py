@@ -0,0 +1,124 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+from services.analysis_cache import shared_cache_enabled
+
+logger = logging.getLogger(__name__)
+
+# Newest first, with the record ID breaking created_at ties so pages never overlap
+HISTORY_SORT: List[Tuple[str, int]] = [("created_at", -1), ("id", -1)]
+
+# Server errors for an index that exists with other options (e.g. a changed TTL); retrying
+# cannot fix them, the old index has to be dropped first
+INDEX_CONFLICT_CODES = (85, 86)
+
+# Indexes created at startup, per collection: (keys, options)
+INDEXES = {
+    "face_analyses": [
+        # History lookups: equality on session_id, then the history sort order
+        ([("session_id", 1)] + HISTORY_SORT, {"name": "session_history"}),
+        # Stats seeding reads the most recent records
+        ([("created_at", -1)], {"name": "created_at"}),
+    ],
+    "analysis_jobs": [
+        ([("id", 1)], {"name": "job_id", "unique": True}),
+    ],
+    "analysis_work": [
+        # Workers lease the oldest queued task, or one whose lease expired
+        ([("status", 1), ("enqueued_at", 1)], {"name": "work_lease"}),
+        ([("status", 1), ("lease_expires_at", 1)], {"name": "work_lease_expiry"}),
+        # Finished tasks only live long enough for the API to read their result
+        ([("finished_at", 1)], {
+            "name": "work_finished_ttl",
+            "expireAfterSeconds": int(os.environ.get('WORK_QUEUE_RESULT_TTL_SECONDS', 3600))
+        }),
+    ],
+}
+
+if shared_cache_enabled():
+    # Expired entries are also ignored on read; the index reclaims their space
+    INDEXES["analysis_cache"] = [
+        ([("created_at", 1)], {
+            "name": "cache_created_ttl",
+            "expireAfterSeconds": int(os.environ.get('ANALYSIS_CACHE_TTL', 3600))
+        }),
+    ]
+
+
+async def ensure_indexes(db):
+    """Create the indexes the analysis queries rely on (idempotent)
+
+    All indexes are requested at once, so an unreachable server costs one
+    server selection timeout rather than one per index. Every index is
+    attempted; if any failed, the first error is raised afterwards so the
+    caller can try again. Conflicts with an existing index are only logged.
+    """
+    async def create(collection: str, keys, options: Dict[str, Any]):
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            if isinstance(e, OperationFailure) and e.code in INDEX_CONFLICT_CODES:
+                logger.error(f"Index {options['name']} on {collection} conflicts with an existing index, "
+                             f"drop that one to apply it: {e}")
+                return
+            logger.error(f"Error creating index {options['name']} on {collection}: {e}")
+            raise
+
+    results = await asyncio.gather(*[
+        create(collection, keys, options)
+        for collection, indexes in INDEXES.items()
+        for keys, options in indexes
+    ], return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+
+def encode_cursor(record: Dict[str, Any]) -> str:
+    """Opaque pagination cursor pointing just past ``record``"""
+    created_at = record["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    payload = json.dumps({"created_at": created_at, "id": record["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Parse a cursor from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["created_at"]), str(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def history_filter(session_id: str, after: Optional[str] = None) -> Dict[str, Any]:
+    """Query for a session's records, starting after the record the cursor points to"""
+    query: Dict[str, Any] = {"session_id": session_id}
+    if after:
+        created_at, record_id = decode_cursor(after)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": record_id}},
+        ]
+    return query
+
+
+def history_projection(fields: Optional[List[str]], allowed: List[str]) -> Dict[str, int]:
+    """Projection returning only ``fields`` (plus what the cursor needs), or everything but _id"""
+    if not fields:
+        return {"_id": 0}
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    projection = {field: 1 for field in fields}
+    projection.update({"_id": 0, "id": 1, "created_at": 1})
+    return projection
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ID = "summary"
+# Set on the summary once it holds the records stored before it existed
+BACKFILLED_FIELD = "backfilled"
+COUNTER_FIELDS = ("total_analyses", "successful_analyses", "failed_analyses", "processing_time_ms_sum")
+
+
+class TopKSketch:
+    """Space-Saving sketch of the most frequent items in bounded memory
+
+    Keeps at most ``capacity`` counters; an unseen item replaces the current
+    minimum and inherits its count, so heavy hitters are never evicted and
+    counts are overestimated by at most the evicted minimum.
+    """
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+
+    def add(self, item: str, count: int = 1):
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+        else:
+            evicted = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(evicted) + count
+
+    def top(self, k: int) -> List[str]:
+        return sorted(self.counts, key=self.counts.get, reverse=True)[:k]
+
+
+class AnalysisStatsAggregator:
+    """Running analysis totals kept up to date at write time
+
+    Every finished analysis bumps in-memory deltas, which a background task
+    folds into a single summary document with ``$inc`` so all API processes
+    share the totals. Most common skin tones and eye colors come from
+    in-process TopKSketch instances, seeded from recent records at startup.
+    Reading the stats is one ``find_one`` by ID regardless of collection size.
+
+    Nothing is written until ``load`` has succeeded: otherwise the first flush
+    would create the summary without the records stored before it. Counts
+    made meanwhile wait in memory and are already part of ``snapshot``.
+    """
+
+    def __init__(self, collection, records_collection, flush_interval: float = 1.0,
+                 top_k: int = 5, sketch_capacity: int = 32,
+                 retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.collection = collection
+        self.records_collection = records_collection
+        self.flush_interval = flush_interval
+        self.top_k = top_k
+        self.skin_tones = TopKSketch(sketch_capacity)
+        self.eye_colors = TopKSketch(sketch_capacity)
+        self._pending: Dict[str, float] = dict.fromkeys(COUNTER_FIELDS, 0)
+        self._flusher: Optional[asyncio.Task] = None
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.loaded = False
+
+    def record(self, response):
+        """Count a finished FaceAnalysisResponse"""
+        self._pending["total_analyses"] += 1
+        if response.success and response.colors is not None:
+            self._pending["successful_analyses"] += 1
+            self._pending["processing_time_ms_sum"] += response.metadata.processing_time_ms
+            self.skin_tones.add(response.colors.skin_tone)
+            self.eye_colors.add(response.colors.eye_color)
+        else:
+            self._pending["failed_analyses"] += 1
+
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def load(self):
+        """Backfill the summary if that never finished and seed the color sketches
+
+        Retries with backoff until it succeeds, so it only returns once the
+        totals can be trusted.
+        """
+        delay = self.retry_delay
+        while True:
+            try:
+                await self._load()
+                self.loaded = True
+                return
+            except Exception as e:
+                logger.error(f"Error loading analysis stats, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def _load(self):
+        summary = await self.collection.find_one({"_id": SUMMARY_ID}, {BACKFILLED_FIELD: 1})
+        if not (summary or {}).get(BACKFILLED_FIELD):
+            await self._backfill()
+
+        recent = await self.records_collection.find(
+            {}, {"colors.skin_tone": 1, "colors.eye_color": 1}
+        ).sort("created_at", -1).limit(100).to_list(100)
+        for record in recent:
+            self.skin_tones.add(record["colors"]["skin_tone"])
+            self.eye_colors.add(record["colors"]["eye_color"])
+
+    async def _backfill(self):
+        # One-off scan for deployments that stored records before the summary existed
+        successful = await self.records_collection.count_documents({})
+        processing_time = 0
+        async for row in self.records_collection.aggregate([
+            {"$group": {"_id": None, "sum": {"$sum": "$metadata.processing_time_ms"}}}
+        ]):
+            processing_time = row["sum"]
+
+        logger.info(f"Backfilling analysis stats from {successful} stored records")
+        await self.collection.update_one(
+            {"_id": SUMMARY_ID},
+            {"$setOnInsert": {
+                "total_analyses": successful,
+                "successful_analyses": successful,
+                "failed_analyses": 0,
+                "processing_time_ms_sum": processing_time,
+            }, "$set": {BACKFILLED_FIELD: True}},
+            upsert=True
+        )
+
+    async def flush(self):
+        deltas = {field: value for field, value in self._pending.items() if value}
+        if not deltas or not self.loaded:
+            return
+        self._pending = dict.fromkeys(COUNTER_FIELDS, 0)
+        try:
+            await self.collection.update_one({"_id": SUMMARY_ID}, {"$inc": deltas}, upsert=True)
+        except Exception as e:
+            logger.error(f"Error updating analysis stats: {e}")
+            # Keep the counts for the next flush
+            for field, value in deltas.items():
+                self._pending[field] += value
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if not self.loaded and any(self._pending.values()):
+            logger.warning("Analysis stats never loaded, dropping counts not yet written")
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Current totals, including counts not yet flushed"""
+        summary = await self.collection.find_one({"_id": SUMMARY_ID}) or {}
+        totals = {field: summary.get(field, 0) + self._pending[field] for field in COUNTER_FIELDS}
+
+        total = totals["total_analyses"]
+        successful = totals["successful_analyses"]
+        return {
+            "total_analyses": total,
+            "successful_analyses": successful,
+            "failed_analyses": totals["failed_analyses"],
+            "success_rate": (successful / total * 100) if total > 0 else 0,
+            "average_processing_time": (totals["processing_time_ms_sum"] / successful) if successful > 0 else 0.0,
+            "most_common_skin_tones": self.skin_tones.top(self.top_k),
+            "most_common_eye_colors": self.eye_colors.top(self.top_k),
+        }
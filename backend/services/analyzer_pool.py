@@ -0,0 +1,101 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyzerPoolTimeout(Exception):
+    """Raised when no analyzer could be checked out before the acquire timeout"""
+
+
+class AnalyzerPool:
+    """Fixed-size pool of FaceAnalyzer instances for concurrent use from threads
+
+    A MediaPipe FaceMesh graph must not run ``process()`` from two threads at
+    once, and each analyzer also owns reusable mask buffers, so every call
+    checks out a whole analyzer. Analyzers are built lazily up to ``size`` and
+    share the color engine and the result cache, both of which are thread-safe.
+
+    Configuration (environment):
+        ANALYZER_POOL_SIZE     number of analyzers (default: CPU count)
+        ANALYZER_POOL_TIMEOUT  seconds to wait for a free analyzer (default: block)
+    """
+
+    def __init__(self, size: Optional[int] = None, acquire_timeout: Optional[float] = None):
+        self.size = size or int(os.environ.get('ANALYZER_POOL_SIZE', 0)) or os.cpu_count() or 1
+        if acquire_timeout is None and os.environ.get('ANALYZER_POOL_TIMEOUT'):
+            acquire_timeout = float(os.environ['ANALYZER_POOL_TIMEOUT'])
+        self.acquire_timeout = acquire_timeout
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._color_engine = None
+        self._cache = None
+
+    @property
+    def in_use(self) -> int:
+        """Number of analyzers currently checked out"""
+        return self._created - self._idle.qsize()
+
+    def _create(self):
+        # Heavy imports wait until the first analyzer is needed
+        from services.analysis_cache import get_analysis_cache
+        from services.color_engine import get_color_engine
+        from services.face_analyzer import FaceAnalyzer
+
+        with self._lock:
+            if self._color_engine is None:
+                self._color_engine = get_color_engine()
+                self._cache = get_analysis_cache()
+        logger.info(f"Creating pooled face analyzer {self._created}/{self.size}")
+        return FaceAnalyzer(color_engine=self._color_engine, cache=self._cache)
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator:
+        """Check out an analyzer for the duration of the block
+
+        Waits up to ``timeout`` seconds (the pool default if omitted, forever if
+        that is None too) and raises AnalyzerPoolTimeout when none frees up.
+        """
+        analyzer = self._checkout(self.acquire_timeout if timeout is None else timeout)
+        try:
+            yield analyzer
+        finally:
+            self._idle.put(analyzer)
+
+    def warm_up(self):
+        """Build every analyzer and run each one once, so no request pays the setup"""
+        analyzers = [self._checkout(None) for _ in range(self.size)]
+        try:
+            for analyzer in analyzers:
+                analyzer.warm_up()
+        finally:
+            for analyzer in analyzers:
+                self._idle.put(analyzer)
+
+    def _checkout(self, timeout: Optional[float]):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            grow = self._created < self.size
+            if grow:
+                self._created += 1
+        if grow:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise AnalyzerPoolTimeout(f"No face analyzer became free within {timeout}s")
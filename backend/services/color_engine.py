@@ -0,0 +1,154 @@
+import numpy as np
+import logging
+import os
+from typing import Dict, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+# Pixels whose channel sum falls outside this range are treated as shadows/highlights
+MIN_BRIGHTNESS = 50
+MAX_BRIGHTNESS = 650
+
+
+class DominantColorEngine:
+    """Base class for dominant color extraction backends
+
+    Engines receive an (N, 3) uint8 pixel array and return the center of the
+    most populated color cluster as a float array in the same channel order.
+    """
+
+    name = "base"
+
+    def filter_pixels(self, pixels: np.ndarray) -> np.ndarray:
+        """Remove very dark and very light pixels (shadows/highlights)"""
+        pixels_reshaped = pixels.reshape(-1, 3)
+        brightness = pixels_reshaped.sum(axis=1, dtype=np.int32)
+        valid_pixels = pixels_reshaped[
+            (brightness > MIN_BRIGHTNESS) & (brightness < MAX_BRIGHTNESS)
+        ]
+
+        if len(valid_pixels) < 10:
+            valid_pixels = pixels_reshaped
+
+        return valid_pixels
+
+    def dominant_color(self, pixels: np.ndarray, n_colors: int = 3) -> np.ndarray:
+        """Return the dominant color of the given pixels"""
+        raise NotImplementedError
+
+
+class KMeansColorEngine(DominantColorEngine):
+    """Reference backend: scikit-learn KMeans with 10 initializations"""
+
+    name = "kmeans"
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+
+    def dominant_color(self, pixels: np.ndarray, n_colors: int = 3) -> np.ndarray:
+        from sklearn.cluster import KMeans
+
+        valid_pixels = self.filter_pixels(pixels)
+
+        kmeans = KMeans(n_clusters=min(n_colors, len(valid_pixels)),
+                        random_state=self.seed, n_init=10)
+        kmeans.fit(valid_pixels)
+
+        # Get the most dominant color (largest cluster)
+        (values, counts) = np.unique(kmeans.labels_, return_counts=True)
+        return kmeans.cluster_centers_[values[np.argmax(counts)]]
+
+
+class LloydColorEngine(DominantColorEngine):
+    """Vectorized NumPy k-means on a capped, seeded pixel sample
+
+    ``n_init`` k-means++ seedings are refined together as one batched Lloyd
+    iteration on at most ``max_samples`` pixels; the run with the lowest
+    inertia wins, as in scikit-learn. A final assignment pass over all
+    filtered pixels picks the largest cluster and computes its center.
+    """
+
+    name = "lloyd"
+
+    def __init__(self, max_samples: int = 2048, n_init: int = 4, max_iter: int = 100,
+                 tol: float = 0.25, seed: int = 42):
+        self.max_samples = max_samples
+        self.n_init = n_init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.seed = seed
+
+    def _seed_centers(self, sample: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        """k-means++ seeding for all runs at once, shape (n_init, k, 3)"""
+        n_init = self.n_init
+        centers = np.empty((n_init, k, 3), dtype=np.float32)
+        centers[:, 0] = sample[rng.integers(len(sample), size=n_init)]
+        closest = self._distances(sample, centers[:, :1])[:, 0]
+        for j in range(1, k):
+            cumulative = np.cumsum(closest, axis=1)
+            totals = cumulative[:, -1]
+            # Runs whose points all coincide with existing centers fall back to a random point
+            picks = np.where(
+                totals > 0,
+                (cumulative < (rng.random(n_init) * totals)[:, None]).sum(axis=1),
+                rng.integers(len(sample), size=n_init)
+            )
+            centers[:, j] = sample[np.minimum(picks, len(sample) - 1)]
+            closest = np.minimum(closest, self._distances(sample, centers[:, j:j + 1])[:, 0])
+        return centers
+
+    @staticmethod
+    def _distances(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Squared distances between (n, 3) points and (runs, k, 3) centers, shape (runs, k, n)"""
+        cross = np.matmul(centers, points.T)
+        return np.maximum(
+            (centers ** 2).sum(axis=2)[:, :, None] - 2 * cross + (points ** 2).sum(axis=1),
+            0
+        )
+
+    def dominant_color(self, pixels: np.ndarray, n_colors: int = 3) -> np.ndarray:
+        valid_pixels = self.filter_pixels(pixels).astype(np.float32)
+        rng = np.random.default_rng(self.seed)
+
+        if len(valid_pixels) > self.max_samples:
+            sample = valid_pixels[rng.choice(len(valid_pixels), self.max_samples, replace=False)]
+        else:
+            sample = valid_pixels
+
+        k = min(n_colors, len(sample))
+        centers = self._seed_centers(sample, k, rng)
+        cluster_ids = np.arange(k)[None, :, None]
+
+        for _ in range(self.max_iter):
+            labels = self._distances(sample, centers).argmin(axis=1)
+            one_hot = (labels[:, None, :] == cluster_ids).astype(np.float32)
+            counts = one_hot.sum(axis=2)
+            sums = np.matmul(one_hot, sample)
+            # Keep the previous center for clusters that lost all their points
+            new_centers = np.where(counts[:, :, None] > 0,
+                                   sums / np.maximum(counts, 1)[:, :, None], centers)
+            shift = ((new_centers - centers) ** 2).sum(axis=(1, 2)).max()
+            centers = new_centers
+            if shift <= self.tol:
+                break
+
+        inertia = self._distances(sample, centers).min(axis=1).sum(axis=1)
+        best_centers = centers[inertia.argmin()][None]
+
+        labels = self._distances(valid_pixels, best_centers)[0].argmin(axis=0)
+        dominant = np.bincount(labels, minlength=k).argmax()
+        return valid_pixels[labels == dominant].mean(axis=0)
+
+
+COLOR_ENGINES: Dict[str, Type[DominantColorEngine]] = {
+    KMeansColorEngine.name: KMeansColorEngine,
+    LloydColorEngine.name: LloydColorEngine,
+}
+
+
+def get_color_engine(name: Optional[str] = None) -> DominantColorEngine:
+    """Build the engine named by ``name`` or the COLOR_ENGINE environment variable"""
+    name = name or os.environ.get('COLOR_ENGINE', LloydColorEngine.name)
+    if name not in COLOR_ENGINES:
+        raise ValueError(f"Unknown color engine '{name}', expected one of {sorted(COLOR_ENGINES)}")
+    return COLOR_ENGINES[name]()
@@ -0,0 +1,32 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    """Build the Motor client configured by the environment
+
+    Configuration (environment):
+        MONGO_URL                         connection string (required)
+        MONGO_MAX_POOL_SIZE               max connections per process (default 100)
+        MONGO_MIN_POOL_SIZE               connections kept open when idle (default 0)
+        MONGO_SERVER_SELECTION_TIMEOUT_MS how long an operation waits for a server (default 30000)
+    """
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+        minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+        serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+    )
+
+
+# The one client (and connection pool) shared by every router in this process;
+# Motor connects lazily, and the app lifespan closes it on shutdown
+client = create_mongo_client()
+db = client[os.environ['DB_NAME']]
@@ -1,27 +1,152 @@
 import cv2
 import numpy as np
-import mediapipe as mp
-from sklearn.cluster import KMeans
 from PIL import Image
-import base64
-import io
 import logging
-from typing import Dict, List, Tuple, Optional
+import os
+import time
+from concurrent.futures import Executor, wait
+from typing import Callable, Dict, List, Sequence, Tuple, Optional, Union
+
+from services.analysis_cache import AnalysisCache, get_analysis_cache
+from services.color_engine import DominantColorEngine, get_color_engine
+from services.ingestion import Base64Decoder, BufferReader, ImageTooLarge, PixelBudget, check_request
 
 logger = logging.getLogger(__name__)
 
+# Combined result key and fallback color for each region
+REGION_RESULTS = {
+    'skin': ('skin_tone', "#F5DEB3"),
+    'eyes': ('eye_color', "#8B4513"),
+    'lips': ('lip_color', "#FFB6C1"),
+    'hair': ('hair_color', "#4E2A04"),
+}
+
+# Bytes pil_to_array converts at a time
+PIL_STRIP_BYTES = 128 * 1024
+
+def decode_image(image_bytes: bytes, max_dimension: int = 0,
+                 budget: Optional[PixelBudget] = None) -> np.ndarray:
+    """Decode encoded image bytes to an RGB array no larger than ``max_dimension`` (0 = full size)
+    
+    The image header is checked against ``budget`` (or the per-image pixel
+    limit) before any pixel is decoded. JPEGs are decoded with PIL's draft
+    mode, which lets libjpeg scale by 1/2, 1/4 or 1/8 during decoding instead
+    of producing the full frame. The pipeline stays in RGB order from here
+    on, as MediaPipe expects.
+    """
+    try:
+        # Read straight from the caller's buffer; io.BytesIO would copy a memoryview
+        pil_image = Image.open(BufferReader(image_bytes))
+        (budget or PixelBudget()).claim(*pil_image.size)
+        
+        if max_dimension:
+            width, height = pil_image.size
+            scale = max(width, height) / max_dimension
+            if scale > 1:
+                # Ask the decoder for the smallest size that still covers the target
+                pil_image.draft('RGB', (int(np.ceil(width / scale)), int(np.ceil(height / scale))))
+                if max(pil_image.size) > max_dimension:
+                    pil_image.thumbnail((max_dimension, max_dimension), Image.BILINEAR, reducing_gap=None)
+        
+        # Convert to RGB if needed
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        
+        return pil_to_array(pil_image)
+        
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Error decoding image: {e}")
+        raise ValueError(f"Invalid image data: {e}")
+
+
+def pil_to_array(pil_image: Image.Image) -> np.ndarray:
+    """Copy an RGB PIL image into a new array, one strip of rows at a time
+    
+    ``np.asarray`` on the whole image goes through ``tobytes``, which joins
+    the encoded chunks into one bytes object and so briefly holds the frame
+    twice. Converting one cropped strip at a time keeps the extra memory to
+    about two strips.
+    """
+    pil_image.load()
+    width, height = pil_image.size
+    array = np.empty((height, width, 3), dtype=np.uint8)
+    if not array.size:
+        return array
+    
+    rows = max(1, PIL_STRIP_BYTES // (width * 3))
+    for top in range(0, height, rows):
+        array[top:top + rows] = pil_image.crop((0, top, width, min(height, top + rows)))
+    return array
+
+def fan_out(executor: Executor, tasks: Sequence[Callable[[], List]]) -> List[List]:
+    """Run the first task in the calling thread and the rest on ``executor``
+    
+    Returns every task's result in order. The caller always does a share of the
+    work itself, so a full executor slows a request down but never deadlocks it.
+    """
+    futures = [executor.submit(task) for task in tasks[1:]]
+    try:
+        first = tasks[0]()
+    finally:
+        wait(futures)
+    return [first] + [future.result() for future in futures]
+
+
 class FaceAnalyzer:
-    def __init__(self):
+    def __init__(self, color_engine: Optional[DominantColorEngine] = None,
+                 max_dimension: Optional[int] = None,
+                 cache: Optional[AnalysisCache] = None,
+                 region_sample_size: Optional[int] = None,
+                 static_image_mode: bool = True):
+        # MediaPipe takes about a second to import (it pulls in matplotlib), so
+        # only processes that actually build an analyzer pay for it
+        import mediapipe as mp
+        
+        # Still images get a full detection pass each; tracking mode (for
+        # frame streams) only re-detects once the tracked face is lost
+        self.static_image_mode = static_image_mode
         self.mp_face_mesh = mp.solutions.face_mesh
         self.mp_drawing = mp.solutions.drawing_utils
         self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
+            static_image_mode=static_image_mode,
             max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
         
+        # Dominant color backend (COLOR_ENGINE env var selects the default)
+        self.color_engine = color_engine or get_color_engine()
+        
+        # Longest image side used for analysis; images are decoded straight to it (0 = full size)
+        if max_dimension is None:
+            max_dimension = int(os.environ.get('ANALYSIS_MAX_DIMENSION', 640))
+        self.max_dimension = max_dimension
+        
+        # Filtered pixels kept per region and image for pooled clustering
+        if region_sample_size is None:
+            region_sample_size = int(os.environ.get('ANALYSIS_REGION_SAMPLES', 2048))
+        self.region_sample_size = region_sample_size
+        
+        # Seconds into analyze_multiple_images after which no new image is started (0 = no limit)
+        self.time_budget = int(os.environ.get('ANALYSIS_TIME_BUDGET_MS', 0)) / 1000
+        
+        # Content-addressed cache of per-image results (ANALYSIS_CACHE_* env vars)
+        self.cache = cache if cache is not None else get_analysis_cache()
+        
+        # Scratch buffers for region masks, grown on demand and reused across calls
+        self._mask_buffers: Dict[str, np.ndarray] = {}
+        
+        # (stage, region, seconds) of the current analyze_multiple_images call, None outside one
+        self._timings: Optional[List[Tuple[str, str, float]]] = None
+        
+        # Base64 is decoded into one buffer reused across images, and the pixels
+        # of the current analyze_multiple_images call are counted against a budget
+        self._base64 = Base64Decoder()
+        self._budget: Optional[PixelBudget] = None
+        
         # Key landmark indices for different facial features
         self.SKIN_LANDMARKS = [
             # Forehead and cheek area landmarks
@@ -48,44 +173,64 @@ class FaceAnalyzer:
             # Forehead and hairline
             9, 10, 151, 234, 127, 162, 21, 54, 103, 67, 109, 10, 151
         ]
+        
+        # Polygons rasterized for each region in the shared label mask. Each region
+        # gets its own bit (skin the highest, so its pixels stay contiguous once
+        # sorted by label) because the skin and hair polygons overlap.
+        self.REGION_POLYGONS = {
+            'skin': [self.SKIN_LANDMARKS],
+            'hair': [self.HAIR_LANDMARKS],
+            'lips': [self.LIP_LANDMARKS],
+            'eyes': [self.EYE_LANDMARKS['left_eye'], self.EYE_LANDMARKS['right_eye']]
+        }
+        self.REGION_BITS = {
+            region: 1 << (len(self.REGION_POLYGONS) - 1 - i)
+            for i, region in enumerate(self.REGION_POLYGONS)
+        }
 
-    def base64_to_image(self, base64_string: str) -> np.ndarray:
-        """Convert base64 string to OpenCV image"""
+    def _record_stage(self, stage: str, started: float, region: str = ''):
+        """Note the time since ``started`` against a pipeline stage"""
+        if self._timings is not None:
+            self._timings.append((stage, region, time.perf_counter() - started))
+
+    def base64_to_bytes(self, base64_string: str) -> memoryview:
+        """Decode a base64 string or data URL to encoded image bytes
+        
+        The bytes live in this analyzer's reusable decode buffer and are only
+        valid until its next decode.
+        """
         try:
-            # Remove data URL prefix if present
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_bytes = base64.b64decode(base64_string)
-            
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB if needed
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            
-            # Convert to numpy array
-            image_array = np.array(pil_image)
-            
-            # Convert RGB to BGR for OpenCV
-            image_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-            
-            return image_bgr
+            return self._base64.decode(base64_string)
             
+        except ImageTooLarge:
+            raise
         except Exception as e:
             logger.error(f"Error converting base64 to image: {e}")
             raise ValueError(f"Invalid image data: {e}")
 
+    def base64_to_image(self, base64_string: str) -> np.ndarray:
+        """Convert base64 string to an RGB image array"""
+        return self.decode_image(self.base64_to_bytes(base64_string))
+
+    def image_bytes(self, image_data: Union[str, bytes]) -> Union[bytes, memoryview]:
+        """Return encoded image bytes from a base64 string/data URL or raw bytes"""
+        if isinstance(image_data, str):
+            return self.base64_to_bytes(image_data)
+        return image_data
+
+    def load_image(self, image_data: Union[str, bytes]) -> np.ndarray:
+        """Load an image from a base64 string/data URL or from raw encoded bytes"""
+        return self.decode_image(self.image_bytes(image_data))
+
+    def decode_image(self, image_bytes: bytes) -> np.ndarray:
+        """Decode encoded image bytes to an RGB array no larger than ``max_dimension``"""
+        return decode_image(image_bytes, self.max_dimension, self._budget)
+
     def extract_face_landmarks(self, image: np.ndarray) -> Optional[List]:
-        """Extract facial landmarks from image"""
+        """Extract facial landmarks from an RGB image"""
         try:
-            # Convert BGR to RGB for MediaPipe
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
             # Process image
-            results = self.face_mesh.process(rgb_image)
+            results = self.face_mesh.process(image)
             
             if results.multi_face_landmarks:
                 return results.multi_face_landmarks[0].landmark
@@ -95,31 +240,61 @@ class FaceAnalyzer:
             logger.error(f"Error extracting face landmarks: {e}")
             return None
 
-    def get_region_pixels(self, image: np.ndarray, landmarks: List, 
+    def landmarks_to_points(self, landmarks, width: int, height: int) -> np.ndarray:
+        """Convert normalized landmarks to an (N, 2) int32 array of pixel coordinates"""
+        if isinstance(landmarks, np.ndarray):
+            return landmarks.astype(np.int32, copy=False)
+        
+        coords = np.array([(landmark.x, landmark.y) for landmark in landmarks], dtype=np.float64)
+        if len(coords) == 0:
+            return np.empty((0, 2), dtype=np.int32)
+        
+        coords *= (width, height)
+        return coords.astype(np.int32)
+
+    def _get_mask(self, height: int, width: int, slot: str = 'region') -> np.ndarray:
+        """Return a zeroed (height, width) view into the reusable mask buffer for ``slot``"""
+        size = height * width
+        buffer = self._mask_buffers.get(slot)
+        if buffer is None or buffer.size < size:
+            buffer = self._mask_buffers[slot] = np.empty(size, dtype=np.uint8)
+        
+        mask = buffer[:size].reshape(height, width)
+        mask.fill(0)
+        return mask
+
+    def get_region_pixels(self, image: np.ndarray, landmarks, 
                          landmark_indices: List[int]) -> np.ndarray:
-        """Extract pixels from specific facial region"""
+        """Extract pixels from specific facial region
+        
+        Only the polygon's bounding box is rasterized, so the cost scales with
+        the region area rather than the frame size. ``landmarks`` may be the
+        MediaPipe landmark list or points from ``landmarks_to_points``.
+        """
         try:
             height, width = image.shape[:2]
             
-            # Convert normalized landmarks to pixel coordinates
-            region_points = []
-            for idx in landmark_indices:
-                if idx < len(landmarks):
-                    landmark = landmarks[idx]
-                    x = int(landmark.x * width)
-                    y = int(landmark.y * height)
-                    region_points.append([x, y])
+            points = self.landmarks_to_points(landmarks, width, height)
+            indices = np.asarray(landmark_indices, dtype=np.intp)
+            pts = points[indices[indices < len(points)]]
             
-            if not region_points:
+            if len(pts) == 0:
                 return np.array([])
             
-            # Create mask for the region
-            mask = np.zeros((height, width), dtype=np.uint8)
-            pts = np.array(region_points, dtype=np.int32)
-            cv2.fillPoly(mask, [pts], 255)
+            # Bounding box of the polygon, clipped to the frame
+            x0, y0 = np.maximum(pts.min(axis=0), 0)
+            x1 = min(int(pts[:, 0].max()) + 1, width)
+            y1 = min(int(pts[:, 1].max()) + 1, height)
+            
+            if x1 <= x0 or y1 <= y0:
+                return np.empty((0,) + image.shape[2:], dtype=image.dtype)
+            
+            # Rasterize the polygon inside the crop only
+            mask = self._get_mask(y1 - y0, x1 - x0)
+            cv2.fillPoly(mask, [pts - (x0, y0)], 255)
             
             # Extract pixels from the region
-            region_pixels = image[mask > 0]
+            region_pixels = image[y0:y1, x0:x1][mask > 0]
             
             return region_pixels
             
@@ -127,37 +302,93 @@ class FaceAnalyzer:
             logger.error(f"Error extracting region pixels: {e}")
             return np.array([])
 
+    def extract_region_pixels(self, image: np.ndarray, landmarks) -> Dict[str, np.ndarray]:
+        """Extract pixels for every region in ``REGION_POLYGONS`` in one pass
+        
+        All polygons are rasterized as bit flags into a single label mask covering
+        their joint bounding box, and the labeled pixels are gathered from the
+        image in one sweep, sorted by label. Regions whose pixels are contiguous
+        in that order are returned as views of the gathered array.
+        """
+        height, width = image.shape[:2]
+        empty = np.empty((0,) + image.shape[2:], dtype=image.dtype)
+        points = self.landmarks_to_points(landmarks, width, height)
+        
+        polygons = {}
+        for region, index_lists in self.REGION_POLYGONS.items():
+            polygons[region] = []
+            for landmark_indices in index_lists:
+                indices = np.asarray(landmark_indices, dtype=np.intp)
+                pts = points[indices[indices < len(points)]]
+                if len(pts) > 0:
+                    polygons[region].append(pts)
+        
+        all_points = [pts for region_polygons in polygons.values() for pts in region_polygons]
+        if not all_points:
+            return {region: empty for region in polygons}
+        
+        # Joint bounding box of all regions, clipped to the frame
+        stacked = np.vstack(all_points)
+        x0, y0 = np.maximum(stacked.min(axis=0), 0)
+        x1 = min(int(stacked[:, 0].max()) + 1, width)
+        y1 = min(int(stacked[:, 1].max()) + 1, height)
+        
+        if x1 <= x0 or y1 <= y0:
+            return {region: empty for region in polygons}
+        
+        labels = self._get_mask(y1 - y0, x1 - x0, slot='labels')
+        
+        for region, region_polygons in polygons.items():
+            if not region_polygons:
+                continue
+            
+            # Rasterize the region inside its own box, then OR its bit into the labels
+            shifted = [pts - (x0, y0) for pts in region_polygons]
+            region_points = np.vstack(shifted)
+            rx0, ry0 = np.maximum(region_points.min(axis=0), 0)
+            rx1 = min(int(region_points[:, 0].max()) + 1, x1 - x0)
+            ry1 = min(int(region_points[:, 1].max()) + 1, y1 - y0)
+            if rx1 <= rx0 or ry1 <= ry0:
+                continue
+            
+            started = time.perf_counter()
+            mask = self._get_mask(ry1 - ry0, rx1 - rx0)
+            for pts in shifted:
+                cv2.fillPoly(mask, [pts - (rx0, ry0)], self.REGION_BITS[region])
+            labels[ry0:ry1, rx0:rx1] |= mask
+            self._record_stage('rasterize', started, region)
+        
+        # Single gather of every labeled pixel, grouped by label
+        started = time.perf_counter()
+        ys, xs = np.nonzero(labels)
+        codes = labels[ys, xs]
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        pixels = image[y0:y1, x0:x1][ys[order], xs[order]]
+        
+        region_pixels = {}
+        for region, bit in self.REGION_BITS.items():
+            selected = np.flatnonzero(codes & bit)
+            if len(selected) == 0:
+                region_pixels[region] = empty
+            elif selected[-1] - selected[0] + 1 == len(selected):
+                region_pixels[region] = pixels[selected[0]:selected[-1] + 1]
+            else:
+                region_pixels[region] = pixels[selected]
+        self._record_stage('gather', started)
+        
+        return region_pixels
+
     def extract_dominant_color(self, pixels: np.ndarray, n_colors: int = 3) -> str:
-        """Extract dominant color using K-means clustering"""
+        """Extract dominant color using the configured clustering engine"""
         try:
             if len(pixels) == 0:
                 return "#000000"
             
-            # Reshape pixels for K-means
-            pixels_reshaped = pixels.reshape(-1, 3)
-            
-            # Remove very dark and very light pixels (shadows/highlights)
-            brightness = np.sum(pixels_reshaped, axis=1)
-            valid_pixels = pixels_reshaped[
-                (brightness > 50) & (brightness < 650)
-            ]
-            
-            if len(valid_pixels) < 10:
-                valid_pixels = pixels_reshaped
-            
-            # Apply K-means clustering
-            kmeans = KMeans(n_clusters=min(n_colors, len(valid_pixels)), 
-                          random_state=42, n_init=10)
-            kmeans.fit(valid_pixels)
+            dominant_color = self.color_engine.dominant_color(pixels, n_colors)
             
-            # Get the most dominant color (largest cluster)
-            labels = kmeans.labels_
-            (values, counts) = np.unique(labels, return_counts=True)
-            dominant_color_idx = values[np.argmax(counts)]
-            dominant_color = kmeans.cluster_centers_[dominant_color_idx]
-            
-            # Convert BGR to RGB and then to HEX
-            r, g, b = int(dominant_color[2]), int(dominant_color[1]), int(dominant_color[0])
+            # Pixels are in RGB order
+            r, g, b = int(dominant_color[0]), int(dominant_color[1]), int(dominant_color[2])
             hex_color = f"#{r:02x}{g:02x}{b:02x}"
             
             return hex_color
@@ -166,11 +397,42 @@ class FaceAnalyzer:
             logger.error(f"Error extracting dominant color: {e}")
             return "#000000"
 
-    def analyze_single_image(self, image: np.ndarray) -> Dict:
-        """Analyze a single image for facial features"""
+    def warm_up(self):
+        """Run the FaceMesh graph and color engine once on a synthetic frame
+        
+        The first ``process()`` call initializes the TFLite interpreters, which
+        would otherwise land on the first real request.
+        """
+        size = self.max_dimension or 640
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, (size * 3 // 4, size, 3), dtype=np.uint8)
+        self.extract_face_landmarks(frame)
+        self.extract_dominant_color(frame.reshape(-1, 3)[:2048])
+
+    def sample_region(self, pixels: np.ndarray) -> bytes:
+        """Filtered pixels of one region, evenly thinned to ``region_sample_size``
+        
+        Returned as packed RGB bytes so per-image results stay small and can be
+        stored in the shared cache as is.
+        """
+        if len(pixels) == 0:
+            return b''
+        
+        valid_pixels = self.color_engine.filter_pixels(pixels)
+        if self.region_sample_size and len(valid_pixels) > self.region_sample_size:
+            # Pixels are in raster order, so an even stride covers the whole region
+            picks = np.linspace(0, len(valid_pixels) - 1, self.region_sample_size).astype(np.intp)
+            valid_pixels = valid_pixels[picks]
+        
+        return np.ascontiguousarray(valid_pixels, dtype=np.uint8).tobytes()
+
+    def extract_region_samples(self, image: np.ndarray) -> Dict:
+        """Find the face and sample every region's pixels, without clustering"""
         try:
             # Extract landmarks
+            started = time.perf_counter()
             landmarks = self.extract_face_landmarks(image)
+            self._record_stage('landmarks', started)
             
             if not landmarks:
                 return {
@@ -178,29 +440,14 @@ class FaceAnalyzer:
                     'error': 'No face detected in image'
                 }
             
-            results = {'face_detected': True}
-            
-            # Extract skin color
-            skin_pixels = self.get_region_pixels(image, landmarks, self.SKIN_LANDMARKS)
-            results['skin_color'] = self.extract_dominant_color(skin_pixels)
+            # Gather every region's pixels in a single labeled-mask pass
+            region_pixels = self.extract_region_pixels(image, landmarks)
             
-            # Extract eye colors
-            left_eye_pixels = self.get_region_pixels(image, landmarks, self.EYE_LANDMARKS['left_eye'])
-            right_eye_pixels = self.get_region_pixels(image, landmarks, self.EYE_LANDMARKS['right_eye'])
+            started = time.perf_counter()
+            samples = {region: self.sample_region(pixels) for region, pixels in region_pixels.items()}
+            self._record_stage('sample', started)
             
-            # Combine eye pixels
-            eye_pixels = np.vstack([left_eye_pixels, right_eye_pixels]) if len(left_eye_pixels) > 0 and len(right_eye_pixels) > 0 else np.array([])
-            results['eye_color'] = self.extract_dominant_color(eye_pixels)
-            
-            # Extract lip color
-            lip_pixels = self.get_region_pixels(image, landmarks, self.LIP_LANDMARKS)
-            results['lip_color'] = self.extract_dominant_color(lip_pixels)
-            
-            # Extract hair color (from forehead/hairline area)
-            hair_pixels = self.get_region_pixels(image, landmarks, self.HAIR_LANDMARKS)
-            results['hair_color'] = self.extract_dominant_color(hair_pixels)
-            
-            return results
+            return {'face_detected': True, 'samples': samples}
             
         except Exception as e:
             logger.error(f"Error analyzing single image: {e}")
@@ -209,98 +456,244 @@ class FaceAnalyzer:
                 'error': f'Analysis failed: {str(e)}'
             }
 
-    def analyze_multiple_images(self, images: List[str]) -> Dict:
-        """Analyze multiple images and combine results"""
+    def analyze_frame(self, image_data: Union[str, bytes]) -> Dict:
+        """Sample one video frame's regions, with telemetry, bypassing the cache
+        
+        Meant for tracking-mode analyzers fed consecutive frames of one stream,
+        which never repeat and must all reach FaceMesh in order.
+        """
+        self._timings = timings = []
+        try:
+            started = time.perf_counter()
+            data = self.image_bytes(image_data)
+            if isinstance(image_data, str):
+                self._record_stage('base64', started)
+            
+            started = time.perf_counter()
+            image = self.decode_image(data)
+            self._record_stage('decode', started)
+            
+            result = self.extract_region_samples(image)
+        except ValueError as e:
+            result = {'face_detected': False, 'error': str(e)}
+        finally:
+            self._timings = None
+        
+        if result['face_detected']:
+            outcome = 'face'
+        else:
+            outcome = 'no_face' if result.get('error') == 'No face detected in image' else 'error'
+        return {**result, 'image_outcomes': {outcome: 1}, 'timings': timings}
+
+    def analyze_single_image(self, image: np.ndarray) -> Dict:
+        """Analyze a single image for facial features"""
+        result = self.extract_region_samples(image)
+        if not result['face_detected']:
+            return result
+        return {'face_detected': True, **self.combine_analysis_results([result])}
+
+    @property
+    def cache_config(self) -> str:
+        """Analyzer settings that affect results, part of every cache key"""
+        return f"{self.color_engine.name}|{self.max_dimension}|{self.region_sample_size}"
+
+    def analyze_image_bytes(self, image_bytes: bytes) -> Tuple[Dict, bool]:
+        """Analyze encoded image bytes through the result cache
+        
+        Returns the single-image result and whether it came from the cache.
+        """
+        key = self.cache.make_key(image_bytes, self.cache_config)
+        
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        
+        started = time.perf_counter()
+        image = self.decode_image(image_bytes)
+        self._record_stage('decode', started)
+        
+        result = self.extract_region_samples(image)
+        
+        # Failed analyses may be transient, so only cache definitive outcomes
+        if result['face_detected'] or result.get('error') == 'No face detected in image':
+            self.cache.set(key, result)
+        
+        return result, False
+
+    def analyze_image(self, image_data: Union[str, bytes]) -> Tuple[Dict, bool]:
+        """Decode base64 if needed and analyze one image through the result cache"""
+        started = time.perf_counter()
+        data = self.image_bytes(image_data)
+        if isinstance(image_data, str):
+            self._record_stage('base64', started)
+        return self.analyze_image_bytes(data)
+
+    def analyze_multiple_images(self, images: List[Union[str, bytes]],
+                                executor: Optional[Executor] = None,
+                                helpers: Sequence['FaceAnalyzer'] = (),
+                                time_budget: Optional[float] = None) -> Dict:
+        """Analyze multiple images (base64 strings or raw bytes) and combine results
+        
+        Besides the combined colors, the result carries telemetry for the caller
+        to record: cache hits/misses, per-image outcomes and stage timings.
+        
+        With an ``executor`` and ``helpers`` (other analyzers this call may use,
+        since a FaceMesh graph only runs one image at a time), the images are
+        split across this analyzer and the helpers and processed concurrently,
+        and the pooled regions are clustered with the same parallelism.
+        
+        Once ``time_budget`` seconds (or ANALYSIS_TIME_BUDGET_MS, whichever is
+        shorter) have passed, no further image is started; the first image
+        always is. The colors then come from the images finished so far, and
+        the result is marked ``partial`` with the skipped images counted.
+        
+        Raises ImageTooLarge when the images exceed the ingestion byte limits,
+        checked before anything is decoded, or the pixel limits, checked from
+        each image header before it is decoded.
+        """
+        check_request(images)
+        
+        self._timings = timings = []
+        budget = PixelBudget()
+        budgets = [seconds for seconds in (time_budget, self.time_budget) if seconds]
+        deadline = time.perf_counter() + min(budgets) if budgets else None
+        parallelism = 1 + len(helpers) if executor is not None else 1
+        analyzers = [self, *helpers][:max(min(parallelism, len(images)), 1)]
+        for analyzer in analyzers:
+            analyzer._timings = timings
+            analyzer._budget = budget
         try:
             all_results = []
-            
-            for i, base64_image in enumerate(images):
-                logger.info(f"Analyzing image {i+1}/{len(images)}")
-                
-                # Convert base64 to image
-                image = self.base64_to_image(base64_image)
-                
-                # Analyze image
-                result = self.analyze_single_image(image)
+            cache_hits = 0
+            outcomes = {'face': 0, 'no_face': 0, 'error': 0}
+            
+            logger.info(f"Analyzing {len(images)} images on {len(analyzers)} analyzers")
+            
+            # Decode base64 and analyze, reusing cached results for known images
+            if len(analyzers) > 1:
+                shares = fan_out(executor, [
+                    lambda analyzer=analyzer, start=start: analyzer._analyze_share(
+                        images, range(start, len(images), len(analyzers)), deadline
+                    )
+                    for start, analyzer in enumerate(analyzers)
+                ])
+                analyzed = [result for share in shares for result in share]
+                analyzed.sort(key=lambda item: item[0])
+            else:
+                analyzed = self._analyze_share(images, range(len(images)), deadline)
+            
+            skipped = len(images) - len(analyzed)
+            if skipped:
+                outcomes['skipped'] = skipped
+                logger.warning(f"Time budget ran out, skipped {skipped} of {len(images)} images")
+            
+            for i, result, cache_hit in analyzed:
+                cache_hits += cache_hit
                 
                 if result['face_detected']:
+                    outcomes['face'] += 1
                     all_results.append(result)
                 else:
+                    outcomes['no_face' if result.get('error') == 'No face detected in image' else 'error'] += 1
                     logger.warning(f"No face detected in image {i+1}")
             
+            telemetry = {
+                'cache_hits': cache_hits,
+                'cache_misses': len(analyzed) - cache_hits if self.cache.enabled else 0,
+                'image_outcomes': outcomes,
+                'timings': timings
+            }
+            
             if not all_results:
                 return {
                     'success': False,
-                    'error': 'No faces detected in any of the provided images'
+                    'error': (f'No faces detected in the {len(analyzed)} images analyzed before the time budget ran out'
+                              if skipped else 'No faces detected in any of the provided images'),
+                    'partial': skipped > 0,
+                    **telemetry
                 }
             
-            # Combine results from all images
-            combined_results = self.combine_analysis_results(all_results)
+            # Cluster each region once over the samples of every image
+            combined_results = self.combine_analysis_results(all_results, executor, parallelism)
             
             return {
                 'success': True,
                 'results': combined_results,
                 'images_analyzed': len(all_results),
-                'total_images': len(images)
+                'total_images': len(images),
+                'partial': skipped > 0,
+                **telemetry
             }
             
+        except ImageTooLarge:
+            raise
         except Exception as e:
             logger.error(f"Error analyzing multiple images: {e}")
             return {
                 'success': False,
-                'error': f'Analysis failed: {str(e)}'
+                'error': f'Analysis failed: {str(e)}',
+                'image_outcomes': {'error': 1},
+                'timings': timings
             }
+        finally:
+            for analyzer in analyzers:
+                analyzer._timings = None
+                analyzer._budget = None
 
-    def combine_analysis_results(self, results: List[Dict]) -> Dict:
-        """Combine analysis results from multiple images"""
+    def _analyze_share(self, images: List[Union[str, bytes]], indices: Sequence[int],
+                       deadline: Optional[float]) -> List[Tuple[int, Dict, bool]]:
+        """Analyze ``images[i]`` for each index in turn until ``deadline`` passes"""
+        analyzed = []
+        for i in indices:
+            # The first image always runs, so a request never comes back empty-handed
+            if i and deadline is not None and time.perf_counter() >= deadline:
+                break
+            analyzed.append((i, *self.analyze_image(images[i])))
+        return analyzed
+
+    def cluster_region(self, results: List[Dict], region: str) -> str:
+        """Dominant color of one region over the pooled samples of every result"""
+        key, default = REGION_RESULTS[region]
+        started = time.perf_counter()
+        samples = [result['samples'][region] for result in results if result['samples'].get(region)]
+        if not samples:
+            return default
+        
+        pixels = np.frombuffer(b''.join(samples), dtype=np.uint8).reshape(-1, 3)
+        color = self.extract_dominant_color(pixels)
+        self._record_stage('cluster', started, region)
+        return color
+
+    def combine_analysis_results(self, results: List[Dict], executor: Optional[Executor] = None,
+                                 parallelism: int = 1) -> Dict:
+        """Combine per-image region samples into one color per feature
+        
+        Each region's samples from all images are pooled and clustered once,
+        so every capture contributes to the result. Regions without any pixels
+        fall back to a default color. With an ``executor`` the regions are
+        clustered up to ``parallelism`` at a time (the color engine is shared
+        and stateless).
+        """
         try:
-            # Collect all colors for each feature
-            skin_colors = []
-            eye_colors = []
-            lip_colors = []
-            hair_colors = []
-            
-            for result in results:
-                if result.get('skin_color'):
-                    skin_colors.append(result['skin_color'])
-                if result.get('eye_color'):
-                    eye_colors.append(result['eye_color'])
-                if result.get('lip_color'):
-                    lip_colors.append(result['lip_color'])
-                if result.get('hair_color'):
-                    hair_colors.append(result['hair_color'])
-            
-            # Get most common color for each feature
-            combined = {
-                'skin_tone': self.get_most_common_color(skin_colors) if skin_colors else "#F5DEB3",
-                'eye_color': self.get_most_common_color(eye_colors) if eye_colors else "#8B4513",
-                'lip_color': self.get_most_common_color(lip_colors) if lip_colors else "#FFB6C1",
-                'hair_color': self.get_most_common_color(hair_colors) if hair_colors else "#4E2A04"
-            }
-            
-            return combined
+            # Hair color comes from the forehead/hairline area
+            regions = list(REGION_RESULTS)
+            if executor is not None and parallelism > 1:
+                shares = fan_out(executor, [
+                    lambda start=start: [
+                        (region, self.cluster_region(results, region))
+                        for region in regions[start::parallelism]
+                    ]
+                    for start in range(min(parallelism, len(regions)))
+                ])
+                colors = dict(color for share in shares for color in share)
+            else:
+                colors = {region: self.cluster_region(results, region) for region in regions}
+            
+            return {REGION_RESULTS[region][0]: colors[region] for region in regions}
             
         except Exception as e:
             logger.error(f"Error combining analysis results: {e}")
-            return {
-                'skin_tone': "#F5DEB3",
-                'eye_color': "#8B4513", 
-                'lip_color': "#FFB6C1",
-                'hair_color': "#4E2A04"
-            }
-
-    def get_most_common_color(self, colors: List[str]) -> str:
-        """Get the most common color from a list"""
-        if not colors:
-            return "#000000"
-        
-        # Simple approach: return the first color
-        # In a more sophisticated implementation, you could:
-        # 1. Convert to RGB and average
-        # 2. Use color distance metrics
-        # 3. Apply more advanced color theory
-        
-        return colors[0] if colors else "#000000"
+            return {key: default for key, default in REGION_RESULTS.values()}
 
     def validate_hex_color(self, hex_color: str) -> bool:
         """Validate if string is a valid hex color"""
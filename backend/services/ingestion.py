@@ -0,0 +1,213 @@
+import binascii
+import io
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Union
+
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Per-image and per-request limits, enforced before anything is decoded
+MAX_IMAGE_BYTES = int(os.environ.get('INGEST_MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.environ.get('INGEST_MAX_REQUEST_BYTES', 24 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get('INGEST_MAX_IMAGE_PIXELS', 40_000_000))
+MAX_REQUEST_PIXELS = int(os.environ.get('INGEST_MAX_REQUEST_PIXELS', 60_000_000))
+
+# Whole HTTP bodies, checked while they are received (JSON bodies carry base64, a third larger)
+MAX_BODY_BYTES = int(os.environ.get('INGEST_MAX_BODY_BYTES', MAX_REQUEST_BYTES * 4 // 3 + 64 * 1024))
+MAX_BATCH_BODY_BYTES = int(os.environ.get('INGEST_MAX_BATCH_BODY_BYTES', 256 * 1024 * 1024))
+
+# Base64 characters decoded per step; a multiple of 4 so every chunk decodes on its own
+BASE64_CHUNK = 256 * 1024
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image or request exceeds the ingestion byte or pixel limits"""
+
+
+def base64_payload_start(data: str) -> int:
+    """Offset of the base64 payload, past a data URL prefix if there is one"""
+    if data.startswith('data:'):
+        return data.index(',', 0, 256) + 1
+    return 0
+
+
+def decoded_size(image_data: Union[str, bytes]) -> int:
+    """Decoded byte size of an image, computed from the base64 length without decoding"""
+    if isinstance(image_data, str):
+        start = base64_payload_start(image_data)
+        length = len(image_data) - start
+        padding = image_data.count('=', max(len(image_data) - 2, start))
+        return length * 3 // 4 - padding
+    return len(image_data)
+
+
+def check_image_sizes(sizes: List[int]):
+    """Raise ImageTooLarge unless every size and their total are within the byte limits"""
+    for i, size in enumerate(sizes):
+        if size > MAX_IMAGE_BYTES:
+            raise ImageTooLarge(f"Image {i + 1} is {size} bytes, the limit is {MAX_IMAGE_BYTES}")
+    total = sum(sizes)
+    if total > MAX_REQUEST_BYTES:
+        raise ImageTooLarge(f"Images total {total} bytes, the limit per request is {MAX_REQUEST_BYTES}")
+
+
+def check_request(images: List[Union[str, bytes]]):
+    """Enforce the byte limits on a request's images before any of them is decoded"""
+    check_image_sizes([decoded_size(image) for image in images])
+
+
+class PixelBudget:
+    """Running pixel count of one request, checked from image headers before decoding"""
+
+    def __init__(self, max_image_pixels: int = MAX_IMAGE_PIXELS, max_request_pixels: int = MAX_REQUEST_PIXELS):
+        self.max_image_pixels = max_image_pixels
+        self.max_request_pixels = max_request_pixels
+        self.used = 0
+        # Analyzers working on the same request in parallel share the budget
+        self._lock = threading.Lock()
+
+    def claim(self, width: int, height: int):
+        pixels = width * height
+        if pixels > self.max_image_pixels:
+            raise ImageTooLarge(f"Image is {width}x{height}, the limit is {self.max_image_pixels} pixels")
+        with self._lock:
+            if self.used + pixels > self.max_request_pixels:
+                raise ImageTooLarge(f"Images exceed the limit of {self.max_request_pixels} pixels per request")
+            self.used += pixels
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only seekable file over a bytes-like object, without copying it
+
+    ``io.BytesIO`` copies anything that is not ``bytes``; PIL only needs
+    read, seek and tell, which this serves straight from the buffer.
+    """
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def __repr__(self) -> str:
+        # Shows up in PIL's "cannot identify image file" errors
+        return f"<{len(self._view)} byte image buffer>"
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class Base64Decoder:
+    """Decodes base64 strings and data URLs chunk by chunk into a reusable buffer
+
+    ``base64.b64decode`` on a str first copies the whole payload to ASCII bytes,
+    and stripping a data URL prefix with ``split`` copies it again. Here the
+    payload is decoded ``BASE64_CHUNK`` characters at a time straight into a
+    buffer that is kept for the next image, so a decode allocates little
+    beyond the buffer growing to the largest image seen.
+
+    The returned memoryview is only valid until the next ``decode`` call. Not
+    thread-safe; every analyzer owns its own decoder.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or MAX_IMAGE_BYTES
+        self._buffer = bytearray()
+
+    def decode(self, data: str) -> memoryview:
+        start = base64_payload_start(data)
+        size = decoded_size(data)
+        if size > self.max_bytes:
+            raise ImageTooLarge(f"Image is {size} bytes, the limit is {self.max_bytes}")
+
+        # Grow by replacing the buffer: a bytearray with live views cannot be resized
+        if len(self._buffer) < size:
+            self._buffer = bytearray(size)
+        view = memoryview(self._buffer)
+
+        written = 0
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK):
+                chunk = binascii.a2b_base64(data[offset:offset + BASE64_CHUNK])
+                view[written:written + len(chunk)] = chunk
+                written += len(chunk)
+        except (binascii.Error, ValueError) as e:
+            # ValueError covers non-ASCII input and chunks that overflow the buffer
+            raise ValueError(f"Invalid base64 image data: {e}")
+        return view[:written]
+
+
+class RequestSizeLimitMiddleware:
+    """Rejects analysis request bodies over the byte limit with 413, while they arrive
+
+    A declared Content-Length over the limit is refused before the body is
+    read; otherwise the received bytes are counted and reading the body fails
+    with a 413 HTTPException as soon as they pass it, so an oversized body is
+    never buffered in full.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_BODY_BYTES, path_prefix: str = "/api/analysis",
+                 overrides: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefix = path_prefix
+        self.overrides = overrides or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.overrides.get(scope["path"], self.max_bytes)
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"Request body is larger than {limit} bytes")
+            return message
+
+        await self.app(scope, counting_receive, send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body is larger than {limit} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
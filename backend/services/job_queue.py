@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AnalysisJobQueue:
+    """Bounded in-process queue of analysis jobs whose state lives in Mongo
+
+    Job documents are written to ``collection`` on submit and on every status
+    change, so any API worker can answer a poll. The payload itself (the
+    images) only lives in memory on the worker that accepted the job.
+
+    Configuration (environment):
+        ANALYSIS_JOB_QUEUE_SIZE  max jobs waiting to start (default 100)
+    """
+
+    def __init__(self, collection, handler: Callable[[Dict[str, Any], Any], Awaitable[Dict]],
+                 concurrency: int = 1, max_queued: Optional[int] = None):
+        self.collection = collection
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_queued = max_queued or int(os.environ.get('ANALYSIS_JOB_QUEUE_SIZE', 100))
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: List[asyncio.Task] = []
+        self._updates: Dict[str, asyncio.Event] = {}
+        # Moving average of job run time, used to estimate Retry-After
+        self._avg_duration = 1.0
+
+    def start(self):
+        """Start the consumer tasks (idempotent, must run inside the event loop)"""
+        if self._consumers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} analysis job consumers")
+
+    async def stop(self):
+        """Stop consuming and mark jobs that never started as failed"""
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+
+        while self._queue is not None and not self._queue.empty():
+            job, _ = self._queue.get_nowait()
+            await self._update(job["id"], JOB_FAILED, error="Server shut down before the job started")
+
+    @property
+    def queued(self) -> int:
+        """Number of jobs waiting to start"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up"""
+        return max(1, math.ceil(self._avg_duration * self.queued / self.concurrency))
+
+    async def submit(self, job: Dict[str, Any], payload: Any) -> Dict[str, Any]:
+        """Persist a new job and queue its payload, or raise JobQueueFull"""
+        self.start()
+        if self._queue.full():
+            raise JobQueueFull(self.retry_after())
+
+        await self.collection.insert_one(dict(job))
+        try:
+            self._queue.put_nowait((job, payload))
+        except asyncio.QueueFull:
+            await self._update(job["id"], JOB_FAILED, error="Job queue is full")
+            raise JobQueueFull(self.retry_after())
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def wait_for_update(self, job_id: str, timeout: float):
+        """Wait until a job handled by this process changes state, or ``timeout`` passes"""
+        event = self._updates.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._updates.pop(job_id, None)
+
+    async def _update(self, job_id: str, status: str, **fields):
+        fields.update(status=status, updated_at=datetime.utcnow())
+        try:
+            await self.collection.update_one({"id": job_id}, {"$set": fields})
+        except Exception as e:
+            logger.error(f"Error updating analysis job {job_id}: {e}")
+
+        event = self._updates.get(job_id)
+        if event is not None:
+            event.set()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, payload = await self._queue.get()
+            started = loop.time()
+            try:
+                await self._update(job["id"], JOB_RUNNING)
+                result = await self.handler(job, payload)
+                await self._update(job["id"], JOB_COMPLETED, result=result)
+            except asyncio.CancelledError:
+                await self._update(job["id"], JOB_FAILED, error="Server shut down while the job was running")
+                raise
+            except Exception as e:
+                logger.error(f"Analysis job {job['id']} failed: {e}")
+                await self._update(job["id"], JOB_FAILED, error=f"Analysis failed: {str(e)}")
+            finally:
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (loop.time() - started)
+                self._queue.task_done()
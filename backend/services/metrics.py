@@ -0,0 +1,177 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Latency buckets in seconds, from a cached lookup up to a slow multi-image request
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values) if value != ""]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._series.items())
+
+        lines = []
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value read from a callback when metrics are rendered"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {self.read()}"]
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text exposition format
+
+    Updates are a dict lookup and an addition under a lock, cheap enough to
+    leave on in production. Analysis worker processes do not report here
+    directly; they return their timings with each result and the API process
+    records them (see ``record_analysis``).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "face_analysis_stage_seconds",
+    "Time spent in each analysis stage; region is set for per-region stages",
+    ("stage", "region")
+)
+IMAGES_TOTAL = registry.counter(
+    "face_analysis_images_total",
+    "Images by outcome (face, no_face, error, skipped when the time budget ran out)",
+    ("outcome",)
+)
+CACHE_LOOKUPS_TOTAL = registry.counter(
+    "face_analysis_cache_lookups_total",
+    "Per-image result cache lookups by result (hit, miss)",
+    ("result",)
+)
+REQUESTS_TOTAL = registry.counter(
+    "face_analysis_requests_total",
+    "Analysis requests by endpoint and outcome (success, failure, rejected, error)",
+    ("endpoint", "outcome")
+)
+REQUEST_SECONDS = registry.histogram(
+    "face_analysis_request_seconds",
+    "End-to-end analysis request latency",
+    ("endpoint",)
+)
+ADMISSIONS_TOTAL = registry.counter(
+    "face_analysis_admissions_total",
+    "Admission decisions for interactive analyses (admitted, queue_full, deadline, timed_out)",
+    ("outcome",)
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "face_analysis_admission_wait_seconds",
+    "Time admitted analyses waited for a slot"
+)
+
+
+def record_analysis(result: Dict):
+    """Record the telemetry an analyzer returned alongside its result"""
+    for stage, region, seconds in result.get('timings', ()):
+        STAGE_SECONDS.observe(seconds, stage, region)
+    for outcome, count in result.get('image_outcomes', {}).items():
+        if count:
+            IMAGES_TOTAL.inc(count, outcome)
+    if result.get('cache_hits'):
+        CACHE_LOOKUPS_TOTAL.inc(result['cache_hits'], "hit")
+    if result.get('cache_misses'):
+        CACHE_LOOKUPS_TOTAL.inc(result['cache_misses'], "miss")
@@ -0,0 +1,139 @@
+import logging
+import math
+import os
+import queue
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Capture steps the client walks through, by index
+POSES = ('front', 'left', 'right')
+
+
+class PresenceDetectorBusy(Exception):
+    """Raised when every detector is in use; presence checks are not worth queueing for"""
+
+
+def classify_pose(yaw: float, front_max: float, profile_min: float) -> Optional[str]:
+    """'front', 'left' or 'right' for a yaw in degrees, None while in between"""
+    if abs(yaw) <= front_max:
+        return 'front'
+    if yaw >= profile_min:
+        return 'left'
+    if yaw <= -profile_min:
+        return 'right'
+    return None
+
+
+class FacePresenceDetector:
+    """Cheap face presence and head pose check for live capture guidance
+
+    Runs MediaPipe's BlazeFace short-range detector (no face mesh, no
+    clustering) on a frame decoded straight down to ``max_dimension``, and
+    estimates yaw from its keypoints: the nose tip's offset from the midpoint
+    of the two ear tragions, relative to half the ear distance, is the sine
+    of the head rotation. Positive yaw means the user turned to their left.
+
+    Detection graphs are not thread-safe, so a small pool of them is kept;
+    when all are busy the check fails fast with PresenceDetectorBusy instead
+    of adding latency, since the client polls again moments later anyway.
+
+    Configuration (environment):
+        PRESENCE_DETECTORS      concurrent detectors (default 2)
+        PRESENCE_MAX_DIMENSION  longest side frames are decoded to (default 256)
+        PRESENCE_MIN_SCORE      minimum detection confidence (default 0.6)
+    """
+
+    def __init__(self, size: Optional[int] = None, max_dimension: Optional[int] = None,
+                 min_score: Optional[float] = None, front_max_yaw: float = 12.0,
+                 profile_min_yaw: float = 25.0):
+        self.size = size or int(os.environ.get('PRESENCE_DETECTORS', 2))
+        self.max_dimension = max_dimension or int(os.environ.get('PRESENCE_MAX_DIMENSION', 256))
+        self.min_score = min_score or float(os.environ.get('PRESENCE_MIN_SCORE', 0.6))
+        self.front_max_yaw = front_max_yaw
+        self.profile_min_yaw = profile_min_yaw
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @property
+    def in_use(self) -> int:
+        """Number of detectors currently running a check"""
+        return self._created - self._idle.qsize()
+
+    @property
+    def busy(self) -> bool:
+        return self.in_use >= self.size
+
+    def _create(self):
+        # MediaPipe loads on the first presence check, not at API startup
+        import mediapipe as mp
+        return mp.solutions.face_detection.FaceDetection(
+            model_selection=0,
+            min_detection_confidence=self.min_score
+        )
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created >= self.size:
+                raise PresenceDetectorBusy(f"All {self.size} presence detectors are busy")
+            self._created += 1
+        try:
+            return self._create()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm_up(self):
+        """Build one detector and run it once, so the first poll does not pay the setup"""
+        import numpy as np
+        detector = self._checkout()
+        try:
+            detector.process(np.zeros((self.max_dimension, self.max_dimension, 3), dtype=np.uint8))
+        finally:
+            self._idle.put(detector)
+
+    def check(self, image_bytes: bytes) -> Dict:
+        """Face presence, score, normalized bounding box, yaw and pose of the most confident face"""
+        from services.face_analyzer import decode_image
+
+        image = decode_image(image_bytes, self.max_dimension)
+        detector = self._checkout()
+        try:
+            results = detector.process(image)
+        finally:
+            self._idle.put(detector)
+
+        if not results.detections:
+            return {'face_detected': False}
+
+        detection = max(results.detections, key=lambda d: d.score[0])
+        box = detection.location_data.relative_bounding_box
+        keypoints = detection.location_data.relative_keypoints
+        nose = keypoints[2].x
+        right_ear, left_ear = keypoints[4].x, keypoints[5].x
+        middle = (right_ear + left_ear) / 2
+        half_width = (left_ear - right_ear) / 2
+
+        yaw = 0.0
+        if abs(half_width) > 1e-6:
+            yaw = math.degrees(math.asin(max(-1.0, min(1.0, (nose - middle) / half_width))))
+
+        return {
+            'face_detected': True,
+            'score': round(detection.score[0], 3),
+            'bbox': {
+                'x': round(max(box.xmin, 0.0), 4),
+                'y': round(max(box.ymin, 0.0), 4),
+                'width': round(box.width, 4),
+                'height': round(box.height, 4)
+            },
+            'yaw': round(yaw, 1),
+            'pose': classify_pose(yaw, self.front_max_yaw, self.profile_min_yaw)
+        }
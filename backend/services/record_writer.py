@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from services.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+# Write error of a record that is already stored, e.g. by an earlier attempt
+DUPLICATE_KEY_ERROR = 11000
+
+
+class RecordWriter:
+    """Write-behind buffer for best-effort Mongo inserts
+
+    Records are queued in memory and written with ``insert_many`` once
+    ``batch_size`` are waiting or ``flush_interval`` seconds have passed, so
+    request handlers never wait on the database. After ``failure_threshold``
+    consecutive failed flushes the circuit opens and new records are shed
+    (and counted) for ``reset_timeout`` seconds; the next flush then probes
+    Mongo again and closes the circuit if it succeeds. Inserts are unordered,
+    so a record the server rejects only drops that record, and one that is
+    already stored (duplicate key) is not dropped at all.
+
+    Configuration (environment):
+        RECORD_WRITER_BATCH_SIZE      records per insert_many (default 100)
+        RECORD_WRITER_FLUSH_INTERVAL  max seconds a record waits (default 1)
+        RECORD_WRITER_MAX_BUFFER      records held before shedding (default 10000)
+    """
+
+    def __init__(self, collection, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_buffer: Optional[int] = None,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.collection = collection
+        self.batch_size = batch_size or int(os.environ.get('RECORD_WRITER_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval or float(os.environ.get('RECORD_WRITER_FLUSH_INTERVAL', 1))
+        self.max_buffer = max_buffer or int(os.environ.get('RECORD_WRITER_MAX_BUFFER', 10000))
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._failures = 0
+        self._opened_at = 0.0
+        self.state = BREAKER_CLOSED
+        self.written = 0
+        self.dropped = 0
+        self.shed = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        """Start the background flusher (idempotent, must run inside the event loop)"""
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Queue a record for writing; returns False if it was shed instead"""
+        if self.state == BREAKER_OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+            self.shed += 1
+            return False
+        if len(self._buffer) >= self.max_buffer:
+            self.shed += 1
+            logger.warning(f"Record buffer full ({self.max_buffer}), shedding write")
+            return False
+
+        self.start()
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Write everything buffered right now"""
+        while self._buffer:
+            batch: List[Dict[str, Any]] = [
+                self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+            await self._write(batch)
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still buffered"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._buffer:
+            logger.info(f"Flushing {len(self._buffer)} buffered records on shutdown")
+            # Shutdown is the last chance, so give an open circuit one more try
+            self.state = BREAKER_HALF_OPEN
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        if self.state == BREAKER_OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.shed += len(batch)
+                return
+            self.state = BREAKER_HALF_OPEN
+
+        started = time.perf_counter()
+        try:
+            result = await self.collection.insert_many(batch, ordered=False)
+            self.written += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # The server answered and wrote every record it did not reject
+            inserted = e.details.get("nInserted", 0)
+            errors = e.details.get("writeErrors", [])
+            duplicates = sum(1 for error in errors if error.get("code") == DUPLICATE_KEY_ERROR)
+            self.written += inserted
+            rejected = len(batch) - inserted - duplicates
+            if rejected:
+                self.dropped += rejected
+                first = next((error for error in errors if error.get("code") != DUPLICATE_KEY_ERROR), {})
+                logger.error(f"{rejected} of {len(batch)} records rejected, first: {first.get('errmsg')}")
+            if e.details.get("writeConcernErrors"):
+                self._record_failure(e)
+                return
+        except Exception as e:
+            self.dropped += len(batch)
+            self._record_failure(e)
+            return
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, 'persist', '')
+
+        self._failures = 0
+        if self.state != BREAKER_CLOSED:
+            logger.info("Record writes recovered, closing circuit")
+            self.state = BREAKER_CLOSED
+
+    def _record_failure(self, error: Exception):
+        self._failures += 1
+        logger.error(f"Error writing records (failure {self._failures}): {error}")
+        if self.state == BREAKER_HALF_OPEN or self._failures >= self.failure_threshold:
+            logger.warning(f"Opening record write circuit for {self.reset_timeout}s")
+            self.state = BREAKER_OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "pending": self.pending,
+            "written": self.written,
+            "dropped": self.dropped,
+            "shed": self.shed,
+        }
@@ -0,0 +1,139 @@
+import logging
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+RGB = Tuple[int, int, int]
+
+
+def _hex_to_rgb(color: str) -> RGB:
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+class StreamingAnalysisSession:
+    """Incremental color estimate over a stream of frames from one client
+
+    Frames go through a tracking-mode analyzer owned by this session, so
+    FaceMesh only runs full detection until it locks onto the face. Each
+    frame's region samples join a sliding window of the last ``window``
+    frames with a face, and the colors are re-clustered over that pool.
+    A region whose two largest clusters are about the same size can flip
+    between them from one frame to the next, so the reported color is the
+    per-channel median of the last ``min_frames`` clustered colors.
+
+    Stability compares the reported estimate with the previous
+    ``min_frames`` ones: 1.0 means no color moved, 0.0 that one moved by
+    ``tolerance`` (RGB distance) or more. The estimate has converged once at
+    least ``min_frames`` faces were seen and stability reaches
+    ``converged_stability``; clients can stop capturing then.
+
+    Frames must be sent one at a time and in order; a lock only guards
+    against ``close`` releasing the graph under a frame still in flight.
+    """
+
+    def __init__(self, analyzer, window: int = 12, min_frames: int = 5,
+                 tolerance: float = 24.0, converged_stability: float = 0.9):
+        self.analyzer = analyzer
+        self.window = window
+        self.min_frames = min_frames
+        self.tolerance = tolerance
+        self.converged_stability = converged_stability
+        self._samples: Deque[Dict] = deque(maxlen=window)
+        self._clustered: Deque[Dict[str, RGB]] = deque(maxlen=min_frames)
+        self._estimates: Deque[Dict[str, RGB]] = deque(maxlen=min_frames + 1)
+        self.frames = 0
+        self.faces = 0
+        self.colors: Optional[Dict[str, str]] = None
+        self.stability = 0.0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def converged(self) -> bool:
+        return self.faces >= self.min_frames and self.stability >= self.converged_stability
+
+    def process_frame(self, image_data: Union[str, bytes]) -> Dict:
+        """Analyze one frame and return the refined estimate plus the frame's telemetry"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Analysis stream session is closed")
+            self.frames += 1
+            result = self.analyzer.analyze_frame(image_data)
+
+        if result['face_detected']:
+            self.faces += 1
+            self._samples.append(result)
+            clustered = self.analyzer.combine_analysis_results(list(self._samples))
+            self._clustered.append({key: _hex_to_rgb(color) for key, color in clustered.items()})
+            self._update_estimate()
+
+        update = {
+            'frame': self.frames,
+            'face_detected': result['face_detected'],
+            'colors': self.colors,
+            'stability': round(self.stability, 3),
+            'converged': self.converged,
+            'frames_used': len(self._samples),
+            'image_outcomes': result['image_outcomes'],
+            'timings': result['timings'],
+        }
+        if not result['face_detected']:
+            update['error'] = result.get('error')
+        return update
+
+    def close(self):
+        """Release the session's FaceMesh graph"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self.analyzer.face_mesh.close()
+
+    def _update_estimate(self):
+        current = {
+            key: tuple(sorted(channel)[len(channel) // 2]
+                       for channel in zip(*(colors[key] for colors in self._clustered)))
+            for key in self._clustered[-1]
+        }
+        self.colors = {key: '#%02x%02x%02x' % rgb for key, rgb in current.items()}
+
+        previous: List[Dict[str, RGB]] = list(self._estimates)
+        self._estimates.append(current)
+        if not previous:
+            self.stability = 0.0
+            return
+
+        drift = max(
+            math.dist(current[key], estimate[key])
+            for estimate in previous[-self.min_frames:] for key in current
+        )
+        self.stability = max(0.0, 1.0 - drift / self.tolerance)
+
+
+def create_stream_session() -> StreamingAnalysisSession:
+    """Build a session with its own tracking-mode analyzer, configured by the environment
+
+    Configuration (environment):
+        STREAM_MAX_DIMENSION   longest side frames are analyzed at (default 480)
+        STREAM_REGION_SAMPLES  pixels kept per region and frame (default 512)
+        STREAM_WINDOW          face frames pooled into the estimate (default 12)
+        STREAM_MIN_FRAMES      face frames required before converging (default 5)
+    """
+    # Heavy imports wait until a client actually opens a stream
+    from services.analysis_cache import AnalysisCache
+    from services.face_analyzer import FaceAnalyzer
+
+    analyzer = FaceAnalyzer(
+        max_dimension=int(os.environ.get('STREAM_MAX_DIMENSION', 480)),
+        cache=AnalysisCache(max_entries=0),
+        region_sample_size=int(os.environ.get('STREAM_REGION_SAMPLES', 512)),
+        static_image_mode=False
+    )
+    return StreamingAnalysisSession(
+        analyzer,
+        window=int(os.environ.get('STREAM_WINDOW', 12)),
+        min_frames=int(os.environ.get('STREAM_MIN_FRAMES', 5))
+    )
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Union
+
+from pymongo import ReturnDocument
+
+from services.ingestion import ImageTooLarge
+
+logger = logging.getLogger(__name__)
+
+TASK_QUEUED = "queued"
+TASK_LEASED = "leased"
+TASK_DONE = "done"
+TASK_FAILED = "failed"
+
+# Task errors the API turns back into ImageTooLarge (413) instead of a failed analysis
+ERROR_TOO_LARGE = "too_large"
+
+
+class AnalysisTaskFailed(Exception):
+    """Raised to the enqueuing side when a task failed, was abandoned or timed out"""
+
+
+class AnalysisWorkQueue:
+    """Durable queue of analyses in Mongo, shared by API processes and analyzer workers
+
+    Each task is one document holding the images until a worker finishes it.
+    Workers lease tasks with an atomic ``find_one_and_update``, so two workers
+    never hold the same live lease, and keep extending the lease while they
+    analyze. A lease that is not extended expires and the task goes to the
+    next worker, so a crashed worker or node delays a task but does not lose
+    it. Delivery is therefore at least once: a slow worker may finish a task
+    another one already re-leased, and only the current lease holder's result
+    is written. Tasks that lost their lease ``max_attempts`` times fail.
+
+    Results are picked up by polling the task document, which works on a
+    single mongod (change streams would need a replica set). Finished tasks
+    are removed by a TTL index on ``finished_at`` (see analysis_history.INDEXES).
+
+    Configuration (environment):
+        WORK_QUEUE_LEASE_SECONDS     lease length, extended while a worker analyzes (default 30)
+        WORK_QUEUE_MAX_ATTEMPTS      leases per task before it fails (default 3)
+        WORK_QUEUE_POLL_SECONDS      longest wait between polls for work or results (default 0.5)
+        WORK_QUEUE_RESULT_TIMEOUT    seconds the API waits for a result (default 120)
+        WORK_QUEUE_MAX_PAYLOAD_BYTES images per task, below Mongo's 16MB document limit (default 15MB)
+    """
+
+    def __init__(self, collection, lease_seconds: Optional[float] = None, max_attempts: Optional[int] = None,
+                 poll_interval: Optional[float] = None, result_timeout: Optional[float] = None,
+                 max_payload_bytes: Optional[int] = None):
+        self.collection = collection
+        self.lease_seconds = lease_seconds or float(os.environ.get('WORK_QUEUE_LEASE_SECONDS', 30))
+        self.max_attempts = max_attempts or int(os.environ.get('WORK_QUEUE_MAX_ATTEMPTS', 3))
+        self.poll_interval = poll_interval or float(os.environ.get('WORK_QUEUE_POLL_SECONDS', 0.5))
+        self.result_timeout = result_timeout or float(os.environ.get('WORK_QUEUE_RESULT_TIMEOUT', 120))
+        self.max_payload_bytes = (
+            max_payload_bytes
+            or int(os.environ.get('WORK_QUEUE_MAX_PAYLOAD_BYTES', 15 * 1024 * 1024))
+        )
+
+    async def enqueue(self, images: List[Union[str, bytes]], time_budget: Optional[float] = None) -> str:
+        """Store a task for the workers and return its ID
+
+        ``time_budget`` is passed on to the analysis and counts from when a
+        worker starts it, not from the enqueue.
+        """
+        size = sum(len(image) for image in images)
+        if size > self.max_payload_bytes:
+            raise ImageTooLarge(f"Images total {size} bytes, the limit per queued analysis is "
+                                f"{self.max_payload_bytes}")
+
+        task_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "_id": task_id,
+            "status": TASK_QUEUED,
+            "images": [bytes(image) if isinstance(image, memoryview) else image for image in images],
+            "time_budget": time_budget,
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "enqueued_at": datetime.utcnow(),
+        })
+        return task_id
+
+    async def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued (or expired) task for ``worker_id``, or None if there is none"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": TASK_QUEUED},
+                    {"status": TASK_LEASED, "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {
+                    "status": TASK_LEASED,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("enqueued_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _held(self, task_id: str, worker_id: str) -> Dict[str, Any]:
+        return {"_id": task_id, "status": TASK_LEASED, "lease_owner": worker_id}
+
+    async def extend(self, task_id: str, worker_id: str) -> bool:
+        """Push the lease out again; False once another worker has taken the task"""
+        result = await self.collection.update_one(
+            self._held(task_id, worker_id),
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    async def complete(self, task_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store the result if ``worker_id`` still holds the lease"""
+        return await self._finish(task_id, worker_id, TASK_DONE, result=result)
+
+    async def fail(self, task_id: str, worker_id: str, error: str, kind: Optional[str] = None) -> bool:
+        """Fail the task for good (for errors a retry would only repeat)"""
+        return await self._finish(task_id, worker_id, TASK_FAILED, error=error, error_kind=kind)
+
+    async def release(self, task_id: str, worker_id: str) -> bool:
+        """Give a leased task back without using up an attempt, e.g. on worker shutdown"""
+        result = await self.collection.update_one(
+            self._held(task_id, worker_id),
+            {"$set": {"status": TASK_QUEUED, "lease_owner": None, "lease_expires_at": None},
+             "$inc": {"attempts": -1}}
+        )
+        return result.matched_count == 1
+
+    async def _finish(self, task_id: str, worker_id: str, status: str, **fields) -> bool:
+        fields.update(status=status, finished_at=datetime.utcnow())
+        result = await self.collection.update_one(
+            self._held(task_id, worker_id),
+            {"$set": fields, "$unset": {"images": ""}}
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Analysis task {task_id} is no longer leased by {worker_id}, dropping its outcome")
+        return result.matched_count == 1
+
+    async def expire_exhausted(self) -> int:
+        """Fail tasks whose last allowed lease expired, returning how many"""
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            {"status": TASK_LEASED, "lease_expires_at": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": TASK_FAILED, "finished_at": now,
+                      "error": f"Analysis workers lost the task {self.max_attempts} times"},
+             "$unset": {"images": ""}}
+        )
+        if result.modified_count:
+            logger.error(f"Failed {result.modified_count} analysis tasks after {self.max_attempts} attempts")
+        return result.modified_count
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Poll until the task finishes and return its result
+
+        Raises ImageTooLarge or AnalysisTaskFailed for failed tasks. On timeout
+        the task is abandoned, so no worker starts it after nobody waits anymore.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.result_timeout)
+        delay = 0.01
+        while True:
+            task = await self.collection.find_one(
+                {"_id": task_id}, {"status": 1, "result": 1, "error": 1, "error_kind": 1}
+            )
+            if task is None:
+                raise AnalysisTaskFailed(f"Analysis task {task_id} disappeared")
+            if task["status"] == TASK_DONE:
+                return task["result"]
+            if task["status"] == TASK_FAILED:
+                if task.get("error_kind") == ERROR_TOO_LARGE:
+                    raise ImageTooLarge(task["error"])
+                raise AnalysisTaskFailed(task.get("error") or "Analysis task failed")
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                await self.abandon(task_id)
+                raise AnalysisTaskFailed(f"No analysis worker finished the task within "
+                                         f"{timeout or self.result_timeout:.0f}s")
+            # Start polling fast, most analyses take well under a second
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.poll_interval)
+
+    async def abandon(self, task_id: str):
+        """Fail a task nobody waits for anymore, unless a worker already has it"""
+        try:
+            await self.collection.update_one(
+                {"_id": task_id, "status": TASK_QUEUED},
+                {"$set": {"status": TASK_FAILED, "finished_at": datetime.utcnow(),
+                          "error": "Abandoned before a worker started it"},
+                 "$unset": {"images": ""}}
+            )
+        except Exception as e:
+            logger.error(f"Error abandoning analysis task {task_id}: {e}")
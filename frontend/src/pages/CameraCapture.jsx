@@ -13,11 +13,22 @@ import axios from "axios";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Live presence checks: how often to poll and the longest side of the preview frame sent
+const PRESENCE_POLL_INTERVAL_MS = 250;
+const PRESENCE_FRAME_SIZE = 256;
+
+const POSE_HINTS = [
+  "Look straight at the camera",
+  "Turn your head further to the left",
+  "Turn your head further to the right"
+];
+
 const CameraCapture = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
+  const presenceCanvasRef = useRef(null);
   const [stream, setStream] = useState(null);
   const [currentStep, setCurrentStep] = useState(0);
   const [capturedImages, setCapturedImages] = useState([]);
@@ -25,6 +36,7 @@ const CameraCapture = () => {
   const [analysisComplete, setAnalysisComplete] = useState(false);
   const [colorResults, setColorResults] = useState(null);
   const [faceDetected, setFaceDetected] = useState(false);
+  const [detectionHint, setDetectionHint] = useState("Position Your Face");
   const [cameraError, setCameraError] = useState(null);
   const [sessionId] = useState(() => `session_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`);
 
@@ -70,9 +82,6 @@ const CameraCapture = () => {
         videoRef.current.srcObject = mediaStream;
       }
       setCameraError(null);
-      
-      // Simulate face detection for mock
-      setTimeout(() => setFaceDetected(true), 1000);
     } catch (error) {
       console.error("Camera access error:", error);
       setCameraError("Unable to access camera. Please ensure you have granted camera permissions.");
@@ -84,7 +93,69 @@ const CameraCapture = () => {
     }
   };
 
-  const captureImage = () => {
+  const captureFrameBlob = (canvas) =>
+    new Promise((resolve, reject) => {
+      canvas.toBlob(
+        (blob) => (blob ? resolve(blob) : reject(new Error("Unable to capture image"))),
+        'image/jpeg',
+        0.8
+      );
+    });
+
+  // Poll the backend's presence check so capture is only enabled with a face in the right pose
+  useEffect(() => {
+    if (!stream || isAnalyzing || analysisComplete) return;
+
+    let cancelled = false;
+    let timer = null;
+
+    const poll = async () => {
+      const started = Date.now();
+      try {
+        const presence = await checkPresence(currentStep);
+        if (!cancelled && presence) {
+          const ready = presence.face_detected && presence.step_ok !== false;
+          setFaceDetected(ready);
+          setDetectionHint(presence.face_detected ? POSE_HINTS[currentStep] : "Position Your Face");
+        }
+      } catch (error) {
+        // A busy or failed check keeps the last state until the next poll
+      } finally {
+        if (!cancelled) {
+          timer = setTimeout(poll, Math.max(0, PRESENCE_POLL_INTERVAL_MS - (Date.now() - started)));
+        }
+      }
+    };
+
+    poll();
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [stream, currentStep, isAnalyzing, analysisComplete]);
+
+  const checkPresence = async (step) => {
+    const video = videoRef.current;
+    if (!video || video.readyState < 2 || !video.videoWidth) return null;
+
+    if (!presenceCanvasRef.current) {
+      presenceCanvasRef.current = document.createElement('canvas');
+    }
+    const canvas = presenceCanvasRef.current;
+    const scale = Math.min(1, PRESENCE_FRAME_SIZE / Math.max(video.videoWidth, video.videoHeight));
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+
+    const formData = new FormData();
+    formData.append("image", await captureFrameBlob(canvas), "preview.jpg");
+    formData.append("step", step);
+
+    const response = await axios.post(`${API}/analysis/presence`, formData);
+    return response.data;
+  };
+
+  const captureImage = async () => {
     if (!faceDetected) {
       toast({
         title: "Face Not Detected",
@@ -102,10 +173,23 @@ const CameraCapture = () => {
     canvas.height = video.videoHeight;
     ctx.drawImage(video, 0, 0);
 
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+    // Binary JPEG for the multipart upload endpoint (no base64 overhead)
+    let imageBlob;
+    try {
+      imageBlob = await captureFrameBlob(canvas);
+    } catch (error) {
+      console.error("Capture error:", error);
+      toast({
+        title: "Capture Failed",
+        description: "Unable to capture the photo. Please try again.",
+        variant: "destructive"
+      });
+      return;
+    }
+
     const newImages = [...capturedImages, {
       step: currentStep,
-      data: imageData,
+      blob: imageBlob,
       timestamp: new Date().toISOString()
     }];
 
@@ -118,9 +202,8 @@ const CameraCapture = () => {
 
     if (currentStep < steps.length - 1) {
       setCurrentStep(currentStep + 1);
-      // Simulate new face detection delay
+      // The next pose is confirmed by the presence checks
       setFaceDetected(false);
-      setTimeout(() => setFaceDetected(true), 1500);
     } else {
       analyzeImages(newImages);
     }
@@ -135,10 +218,14 @@ const CameraCapture = () => {
         description: "Processing your facial features with AI",
       });
 
-      const response = await axios.post(`${API}/analysis/analyze-face`, {
-        images: images,
-        session_id: sessionId
+      const formData = new FormData();
+      images.forEach((image) => {
+        formData.append("images", image.blob, `step-${image.step}.jpg`);
+        formData.append("steps", image.step);
       });
+      formData.append("session_id", sessionId);
+
+      const response = await axios.post(`${API}/analysis/analyze-face/upload`, formData);
 
       if (response.data.success) {
         setColorResults(response.data.colors);
@@ -171,7 +258,7 @@ const CameraCapture = () => {
     setAnalysisComplete(false);
     setColorResults(null);
     setFaceDetected(false);
-    setTimeout(() => setFaceDetected(true), 1000);
+    setDetectionHint("Position Your Face");
   };
 
   const progress = ((currentStep) / steps.length) * 100;
@@ -321,7 +408,7 @@ const CameraCapture = () => {
                     faceDetected ? 'bg-green-500' : 'bg-red-500'
                   }`} />
                   <span className="text-sm">
-                    {faceDetected ? 'Face Detected' : 'Position Your Face'}
+                    {faceDetected ? 'Face Detected' : detectionHint}
                   </span>
                 </div>
               </CardContent>
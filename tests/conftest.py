@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other as top-level packages (services, routes, models)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def mongo_db():
+    """Scratch database on a reachable MongoDB (MONGO_URL), dropped afterwards
+
+    Tests using it are skipped without one; a single mongod is enough.
+    """
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(MONGO_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("MongoDB is not available")
+
+    db = client[f"test_{uuid.uuid4().hex[:8]}"]
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+
+@pytest.fixture
+def run_with_mongo(mongo_db):
+    """Run ``scenario(db)`` against the scratch database through Motor, in a fresh event loop"""
+    motor = pytest.importorskip("motor.motor_asyncio")
+
+    def run(scenario):
+        async def main():
+            # Motor clients belong to the event loop they were created on
+            client = motor.AsyncIOMotorClient(MONGO_URL)
+            try:
+                await scenario(client[mongo_db.name])
+            finally:
+                client.close()
+        asyncio.run(main())
+
+    return run
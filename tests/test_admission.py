@@ -0,0 +1,83 @@
+"""
+Admission controller tests
+"""
+
+import asyncio
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected
+
+
+def run_requests(controller, requests):
+    """Run (timeout, work seconds) requests concurrently, returning each one's outcome"""
+    async def request(timeout, work):
+        try:
+            async with controller.admit(timeout):
+                await asyncio.sleep(work)
+            return "ok"
+        except AdmissionRejected as e:
+            assert e.retry_after >= 1
+            return str(e).split()[0]
+
+    async def main():
+        tasks = []
+        for timeout, work in requests:
+            tasks.append(asyncio.create_task(request(timeout, work)))
+            await asyncio.sleep(0)
+        outcomes = await asyncio.gather(*tasks)
+        assert controller.active == 0 and controller.waiting == 0
+        return outcomes
+
+    return asyncio.run(main())
+
+
+def test_queue_is_bounded():
+    controller = AdmissionController(2, max_waiting=2, default_deadline=5)
+    controller._avg_duration = 0.05
+    outcomes = run_requests(controller, [(5, 0.05)] * 5)
+    assert outcomes == ["ok", "ok", "ok", "ok", "Admission"]
+
+
+def test_requests_that_cannot_start_in_time_are_shed():
+    controller = AdmissionController(1, max_waiting=10, default_deadline=5)
+    controller._avg_duration = 0.2
+    outcomes = run_requests(controller, [
+        (5, 0.5),
+        # Expected wait 0.2s: rejected up front
+        (0.1, 0),
+        # Expected wait fits, but the slot frees up too late
+        (0.3, 0),
+        (5, 0),
+    ])
+    assert outcomes == ["ok", "Expected", "Deadline", "ok"]
+
+
+def test_deadline_header():
+    controller = AdmissionController(1, default_deadline=10, max_deadline=30)
+    assert controller.timeout_from_header("250") == pytest.approx(0.25)
+    assert controller.timeout_from_header(None) == 10
+    assert controller.timeout_from_header("soon") == 10
+    assert controller.timeout_from_header("-5") == 10
+    assert controller.timeout_from_header("99999999") == 30
+
+
+def test_slot_released_at_the_deadline_is_not_lost():
+    async def main():
+        controller = AdmissionController(1, max_waiting=2, default_deadline=5)
+        controller._avg_duration = 0.01
+        loop = asyncio.get_running_loop()
+        await controller._acquire(loop.time() + 1)
+
+        # The holder finishes exactly when the waiter's deadline passes
+        deadline = loop.time() + 0.05
+        loop.call_at(deadline, controller._release)
+        try:
+            await controller._acquire(deadline)
+        except AdmissionRejected:
+            pass
+        else:
+            controller._release()
+        assert controller.active == 0 and controller.waiting == 0
+
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Analysis cache tests
+"""
+
+import time
+
+from services.analysis_cache import AnalysisCache
+
+
+class UnreachableCollection:
+    """Shared collection stand-in that fails every call like a server that is down"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def find_one(self, *args, **kwargs):
+        self.calls += 1
+        raise ConnectionError("No servers found yet")
+
+    replace_one = find_one
+
+
+def test_shared_tier_is_skipped_after_a_failure():
+    shared = UnreachableCollection()
+    cache = AnalysisCache(max_entries=8, shared_collection=shared, shared_cooldown=0.2)
+
+    assert cache.get("a") is None
+    assert shared.calls == 1
+
+    # Within the cooldown neither misses nor writes wait on the shared tier
+    assert cache.get("b") is None
+    cache.set("b", {"skin": []})
+    assert shared.calls == 1
+    assert cache.get("b") == {"skin": []}
+
+    # Afterwards the shared tier is tried again
+    time.sleep(0.2)
+    assert cache.get("c") is None
+    assert shared.calls == 2
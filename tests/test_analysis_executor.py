@@ -0,0 +1,44 @@
+"""
+Analysis executor tests
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.analysis_executor import AnalysisExecutor, AnalysisQueueFull
+
+
+class SlowAnalyzer:
+    """FaceAnalyzer stand-in that holds its pooled analyzer for a while"""
+
+    def __init__(self, color_engine=None, cache=None):
+        pass
+
+    def analyze_multiple_images(self, images, fan_out=None, helpers=None, time_budget=None):
+        time.sleep(0.3)
+        return {"success": False, "error": "No face detected in any image"}
+
+
+def test_analyzer_pool_timeout_is_a_full_queue(monkeypatch):
+    face_analyzer = pytest.importorskip("services.face_analyzer")
+    monkeypatch.setattr(face_analyzer, "FaceAnalyzer", SlowAnalyzer)
+    # Two threads share one analyzer and give up on it quickly
+    monkeypatch.setenv("ANALYZER_POOL_SIZE", "1")
+    monkeypatch.setenv("ANALYZER_POOL_TIMEOUT", "0.05")
+    executor = AnalysisExecutor(max_workers=2, mode='thread')
+
+    async def main():
+        outcomes = await asyncio.gather(
+            *[executor.analyze_multiple_images(["image"]) for _ in range(2)],
+            return_exceptions=True
+        )
+        assert sum(isinstance(outcome, AnalysisQueueFull) for outcome in outcomes) == 1
+        assert sum(isinstance(outcome, dict) for outcome in outcomes) == 1
+        assert executor.pending == 0
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
@@ -0,0 +1,63 @@
+"""
+Analysis history query tests
+
+The explain test needs a reachable MongoDB (see the mongo_db fixture in
+conftest.py) and is skipped without one.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.analysis_history import (
+    HISTORY_SORT,
+    INDEXES,
+    decode_cursor,
+    encode_cursor,
+    history_filter,
+)
+
+
+def winning_stages(plan):
+    """Flatten a query plan into its stage names and index names"""
+    stages = [(plan.get("stage"), plan.get("indexName"))]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += winning_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += winning_stages(child)
+    return stages
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    cursor = encode_cursor({"created_at": created_at, "id": "abc"})
+    assert decode_cursor(cursor) == (created_at, "abc")
+
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_history_query_uses_session_index(mongo_db):
+    collection = mongo_db.face_analyses
+    for keys, options in INDEXES["face_analyses"]:
+        collection.create_index(keys, **options)
+
+    start = datetime(2024, 1, 1)
+    collection.insert_many([
+        {"id": str(uuid.uuid4()), "session_id": f"session-{i % 20}", "created_at": start + timedelta(minutes=i)}
+        for i in range(500)
+    ])
+
+    first_page = list(collection.find(history_filter("session-3")).sort(HISTORY_SORT).limit(5))
+    after = encode_cursor(first_page[-1])
+
+    for query in (history_filter("session-3"), history_filter("session-3", after)):
+        explain = collection.find(query).sort(HISTORY_SORT).limit(5).explain()
+        stages = winning_stages(explain["queryPlanner"]["winningPlan"])
+
+        assert ("IXSCAN", "session_history") in stages
+        assert "COLLSCAN" not in [stage for stage, _ in stages]
+        # The index provides the order, so there is no blocking in-memory sort
+        assert "SORT" not in [stage for stage, _ in stages]
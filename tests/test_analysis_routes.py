@@ -0,0 +1,82 @@
+"""
+Analysis route scheduling tests
+
+The executor is replaced by one with the real pending cap that sleeps
+instead of analyzing, so only the routes' use of executor capacity is tested.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+
+from starlette.requests import Request
+
+import routes.analysis as analysis_routes
+from models.analysis import FaceAnalysisRequest
+from services.admission import AdmissionController
+from services.analysis_executor import AnalysisQueueFull
+
+
+class SleepingExecutor:
+    """AnalysisExecutor stand-in: rejects past ``max_queue_depth`` pending and finds no face"""
+
+    def __init__(self, max_workers: int, max_queue_depth: int, duration: float = 0.02):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.duration = duration
+        self.pending = 0
+        self.peak = 0
+
+    async def analyze_multiple_images(self, images, time_budget=None):
+        if self.pending >= self.max_queue_depth:
+            raise AnalysisQueueFull(f"Analysis queue is full ({self.pending}/{self.max_queue_depth} pending)")
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        try:
+            await asyncio.sleep(self.duration)
+            return {"success": False, "error": "No face detected in any image"}
+        finally:
+            self.pending -= 1
+
+
+def make_item(session_id):
+    return FaceAnalysisRequest(
+        images=[{"step": 0, "data": "aGVsbG8=", "timestamp": "2024-01-01T00:00:00"}],
+        session_id=session_id
+    )
+
+
+def make_http_request():
+    return Request({"type": "http", "headers": [], "client": ("127.0.0.1", 0)})
+
+
+def test_concurrent_batches_leave_room_for_interactive_requests(monkeypatch):
+    executor = SleepingExecutor(max_workers=2, max_queue_depth=4)
+    admission = AdmissionController(executor.max_workers, default_deadline=5)
+    recorded = []
+    monkeypatch.setattr(analysis_routes, "analysis_executor", executor)
+    monkeypatch.setattr(analysis_routes, "admission", admission)
+    monkeypatch.setattr(analysis_routes.analysis_stats, "record", recorded.append)
+
+    async def run_batch(name):
+        items = [make_item(f"{name}-{i}") for i in range(8)]
+        return [line async for line in analysis_routes.stream_batch_results(items, make_http_request())]
+
+    async def main():
+        # Two slots for background work: the queue holds 4, admission lets 2 interactive requests in
+        monkeypatch.setattr(analysis_routes, "background_slots", asyncio.Semaphore(2))
+        batches = [asyncio.create_task(run_batch(name)) for name in ("first", "second")]
+        await asyncio.sleep(executor.duration / 2)
+
+        # Both batches are analyzing, yet the admitted request still finds executor capacity
+        response = await analysis_routes.run_face_analysis(["aGVsbG8="], "interactive", make_http_request())
+        assert response.error == "No face detected in any image"
+
+        results = await asyncio.gather(*batches)
+        assert [len(lines) for lines in results] == [9, 9]
+        assert executor.peak <= executor.max_queue_depth
+
+    asyncio.run(main())
+    assert len(recorded) == 17
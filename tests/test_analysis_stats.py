@@ -0,0 +1,71 @@
+"""
+Analysis stats aggregator tests
+
+These need a reachable MongoDB (see the mongo_db fixture in conftest.py) and
+are skipped without one.
+"""
+
+from datetime import datetime
+
+from models.analysis import AnalysisMetadata, ColorAnalysis, FaceAnalysisResponse
+from services.analysis_stats import SUMMARY_ID, AnalysisStatsAggregator
+
+COLORS = {"skin_tone": "#C68642", "eye_color": "#634E34", "lip_color": "#B5651D", "hair_color": "#2C1B18"}
+
+
+class UnreachableAtFirst:
+    """Collection wrapper whose first ``failures`` summary reads fail like an unreachable server"""
+
+    def __init__(self, collection, failures: int):
+        self.collection = collection
+        self.failures = failures
+
+    async def find_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("No servers found yet")
+        return await self.collection.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def successful_response(processing_time_ms):
+    return FaceAnalysisResponse(
+        success=True,
+        colors=ColorAnalysis(**COLORS),
+        metadata=AnalysisMetadata(total_images=1, images_analyzed=1, processing_time_ms=processing_time_ms)
+    )
+
+
+def test_records_stored_before_a_failed_load_are_counted(run_with_mongo):
+    async def scenario(db):
+        await db.face_analyses.insert_many([
+            {"colors": COLORS, "metadata": {"processing_time_ms": 100}, "created_at": datetime.utcnow()}
+            for _ in range(3)
+        ])
+        stats = AnalysisStatsAggregator(
+            UnreachableAtFirst(db.analysis_stats, failures=2), db.face_analyses, retry_delay=0.01
+        )
+
+        # Counted while the first loads fail, but not written before the backfill
+        stats.record(successful_response(40))
+        await stats.flush()
+        assert await db.analysis_stats.find_one({"_id": SUMMARY_ID}) is None
+
+        await stats.load()
+        assert stats.loaded
+        await stats.stop()
+
+        summary = await db.analysis_stats.find_one({"_id": SUMMARY_ID})
+        assert summary["total_analyses"] == 4
+        assert summary["successful_analyses"] == 4
+        assert summary["processing_time_ms_sum"] == 340
+        assert stats.skin_tones.top(1) == [COLORS["skin_tone"]]
+
+        # A later process finds the backfill done and does not count the records again
+        restarted = AnalysisStatsAggregator(db.analysis_stats, db.face_analyses)
+        await restarted.load()
+        assert (await restarted.snapshot())["total_analyses"] == 4
+
+    run_with_mongo(scenario)
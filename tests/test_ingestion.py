@@ -0,0 +1,93 @@
+"""
+Image ingestion tests
+
+Peak allocation is measured with tracemalloc, which sees Python and NumPy
+allocations but not PIL's internal frame; the bound covers what the
+ingestion path itself holds per image.
+"""
+
+import base64
+import io
+import tracemalloc
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from services.ingestion import Base64Decoder, ImageTooLarge, PixelBudget, check_request
+
+
+def make_data_url(width, height):
+    """Noise PNG as a data URL, so its encoded size is close to its pixel size"""
+    pixels = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=1)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode(), pixels
+
+
+def peak_allocation(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_decode_peak_allocation_is_bounded():
+    decode_image = pytest.importorskip("services.face_analyzer").decode_image
+    data_url, pixels = make_data_url(1600, 1200)
+    decoder = Base64Decoder()
+
+    image, first_peak = peak_allocation(lambda: decode_image(decoder.decode(data_url)))
+    assert np.array_equal(image, pixels)
+    encoded_size = len(data_url) * 3 // 4
+
+    # The decode buffer plus one copy of the frame, with a little slack for chunks
+    assert first_peak < encoded_size + pixels.nbytes + 1024 * 1024
+
+    # The next image reuses the buffer, so only the frame is allocated
+    image, second_peak = peak_allocation(lambda: decode_image(decoder.decode(data_url)))
+    assert second_peak < pixels.nbytes + 1024 * 1024
+
+    # Downscaled analysis never holds a full-size frame
+    image, scaled_peak = peak_allocation(lambda: decode_image(decoder.decode(data_url), 640))
+    assert image.shape == (480, 640, 3)
+    assert scaled_peak < pixels.nbytes // 4
+
+
+def test_base64_decoder_matches_b64decode():
+    payload = bytes(range(256)) * 4099
+    encoded = base64.b64encode(payload).decode()
+
+    decoder = Base64Decoder()
+    assert bytes(decoder.decode(encoded)) == payload
+    assert bytes(decoder.decode("data:image/jpeg;base64," + encoded[:400])) == payload[:300]
+
+    with pytest.raises(ValueError):
+        decoder.decode("data:image/jpeg;base64,not*base64")
+
+
+def test_byte_limits_are_checked_before_decoding(monkeypatch):
+    monkeypatch.setattr("services.ingestion.MAX_IMAGE_BYTES", 3000)
+    monkeypatch.setattr("services.ingestion.MAX_REQUEST_BYTES", 5000)
+    image = base64.b64encode(bytes(2400)).decode()
+
+    check_request([image, image[:400]])
+    with pytest.raises(ImageTooLarge):
+        check_request([image, image, image])
+    with pytest.raises(ImageTooLarge):
+        check_request([bytes(3001)])
+    with pytest.raises(ImageTooLarge):
+        Base64Decoder(max_bytes=2000).decode(image)
+
+
+def test_pixel_budget():
+    budget = PixelBudget(max_image_pixels=1000, max_request_pixels=1500)
+    budget.claim(20, 40)
+    with pytest.raises(ImageTooLarge):
+        budget.claim(40, 40)
+    with pytest.raises(ImageTooLarge):
+        budget.claim(20, 40)
+    budget.claim(10, 70)
@@ -0,0 +1,37 @@
+"""
+Record writer tests
+"""
+
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+from services.record_writer import BREAKER_CLOSED, DUPLICATE_KEY_ERROR, RecordWriter
+
+
+class PartlyRejectingCollection:
+    """Collection stand-in whose unordered inserts store all but the given records"""
+
+    def __init__(self, duplicates, invalid):
+        self.duplicates = duplicates
+        self.invalid = invalid
+
+    async def insert_many(self, documents, ordered=True):
+        errors = [
+            {"index": i, "code": DUPLICATE_KEY_ERROR if i in self.duplicates else 2, "errmsg": "rejected"}
+            for i in range(len(documents)) if i in self.duplicates or i in self.invalid
+        ]
+        raise BulkWriteError({"nInserted": len(documents) - len(errors), "writeErrors": errors,
+                              "writeConcernErrors": []})
+
+
+def test_partial_bulk_write_only_drops_rejected_records():
+    writer = RecordWriter(PartlyRejectingCollection(duplicates={1, 2}, invalid={4}), batch_size=10)
+
+    async def main():
+        for i in range(10):
+            writer.add({"id": i})
+        await writer.stop()
+
+    asyncio.run(main())
+    assert writer.stats() == {"state": BREAKER_CLOSED, "pending": 0, "written": 7, "dropped": 1, "shed": 0}
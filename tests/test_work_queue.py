@@ -0,0 +1,101 @@
+"""
+Analysis work queue tests
+
+These need a reachable MongoDB (see the mongo_db fixture in conftest.py) and
+are skipped without one.
+"""
+
+import asyncio
+
+import pytest
+
+from services.ingestion import ImageTooLarge
+from services.work_queue import ERROR_TOO_LARGE, AnalysisTaskFailed, AnalysisWorkQueue
+
+
+@pytest.fixture
+def run_with_queue(run_with_mongo):
+    def run(scenario, **options):
+        async def with_queue(db):
+            await scenario(AnalysisWorkQueue(db.analysis_work, **options))
+        run_with_mongo(with_queue)
+
+    return run
+
+
+def test_tasks_are_leased_once_in_order(run_with_queue):
+    async def scenario(queue):
+        first = await queue.enqueue(["a"])
+        second = await queue.enqueue([b"b"])
+
+        leased = await asyncio.gather(*[queue.lease(f"worker-{i}") for i in range(4)])
+        assert sorted(task["_id"] for task in leased if task) == sorted([first, second])
+
+        owner = next(task["lease_owner"] for task in leased if task and task["_id"] == first)
+        assert await queue.complete(first, owner, {"success": True})
+        assert await queue.wait(first) == {"success": True}
+
+        # Oldest first
+        third = await queue.enqueue(["c"])
+        await queue.enqueue(["d"])
+        assert (await queue.lease("worker"))["_id"] == third
+
+    run_with_queue(scenario)
+
+
+def test_expired_lease_moves_to_another_worker(run_with_queue):
+    async def scenario(queue):
+        task_id = await queue.enqueue(["a"])
+        assert (await queue.lease("crashed"))["attempts"] == 1
+        assert await queue.lease("other") is None
+
+        await asyncio.sleep(0.3)
+        task = await queue.lease("other")
+        assert task["_id"] == task_id and task["attempts"] == 2
+
+        # The first worker's late result is dropped, the lease holder's is kept
+        assert not await queue.complete(task_id, "crashed", {"success": False})
+        assert not await queue.extend(task_id, "crashed")
+        assert await queue.complete(task_id, "other", {"success": True})
+        assert (await queue.wait(task_id))["success"]
+
+    run_with_queue(scenario, lease_seconds=0.2)
+
+
+def test_tasks_fail_after_max_attempts(run_with_queue):
+    async def scenario(queue):
+        task_id = await queue.enqueue(["a"])
+        for attempt in range(2):
+            assert await queue.lease(f"worker-{attempt}") is not None
+            await asyncio.sleep(0.15)
+
+        assert await queue.lease("late") is None
+        assert await queue.expire_exhausted() == 1
+        with pytest.raises(AnalysisTaskFailed):
+            await queue.wait(task_id)
+
+    run_with_queue(scenario, lease_seconds=0.1, max_attempts=2)
+
+
+def test_release_and_failures(run_with_queue):
+    async def scenario(queue):
+        task_id = await queue.enqueue(["a"])
+        await queue.lease("stopping")
+        assert await queue.release(task_id, "stopping")
+        task = await queue.lease("next")
+        assert task["attempts"] == 1
+
+        assert await queue.fail(task_id, "next", "Image is too large", ERROR_TOO_LARGE)
+        with pytest.raises(ImageTooLarge):
+            await queue.wait(task_id)
+
+        with pytest.raises(ImageTooLarge):
+            await queue.enqueue([b"x" * 1001])
+
+        # Nobody leases it, so the waiter gives up and the task is abandoned
+        abandoned = await queue.enqueue(["a"])
+        with pytest.raises(AnalysisTaskFailed):
+            await queue.wait(abandoned, timeout=0.1)
+        assert await queue.lease("late") is None
+
+    run_with_queue(scenario, max_payload_bytes=1000)